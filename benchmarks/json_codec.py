@@ -0,0 +1,53 @@
+"""Compare the JSON codecs available to fig.util.jsoncodec on a detection-sized event.
+
+Usage: python -m benchmarks.json_codec [iterations]
+"""
+import sys
+import timeit
+from fig.util import jsoncodec
+
+
+def sample_event():
+    return {
+        'metadata': {
+            'customerIDString': '0123456789abcdef0123456789abcdef',
+            'offset': 1234567,
+            'eventType': 'EppDetectionSummaryEvent',
+            'eventCreationTime': 1700000000000,
+            'version': '1.0',
+        },
+        'event': {
+            'SeverityName': 'High',
+            'Severity': 4,
+            'CommandLine': 'C:\\Windows\\System32\\cmd.exe /c "powershell -enc ' + 'A' * 2048 + '"',
+            'FalconHostLink': 'https://falcon.crowdstrike.com/activity/detections/detail/0123/4567',
+            'MitreAttack': [
+                {'Tactic': 'Execution', 'Technique': 'PowerShell', 'TacticID': 'TA0002', 'TechniqueID': 'T1059.001'}
+                for _ in range(5)
+            ],
+            'NetworkAccesses': [
+                {'LocalAddress': '10.0.0.{}'.format(i), 'RemoteAddress': '192.0.2.{}'.format(i), 'RemotePort': 443}
+                for i in range(50)
+            ],
+            'Description': 'Détection — non-ASCII payload',
+        },
+    }
+
+
+def main(iterations):
+    event = sample_event()
+    encoded = jsoncodec.dumpb(event)
+    print('Event size: {} bytes, {} iterations'.format(len(encoded), iterations))
+    for codec in jsoncodec.CODECS:
+        if jsoncodec.CODECS[codec] is None:
+            print('{:8} not installed'.format(codec))
+            continue
+        _name, loads, dumps, _dumpb = jsoncodec.select(codec)
+        load_time = timeit.timeit(lambda: loads(encoded), number=iterations)  # pylint: disable=cell-var-from-loop
+        dump_time = timeit.timeit(lambda: dumps(event), number=iterations)  # pylint: disable=cell-var-from-loop
+        print('{:8} loads {:8.2f} us/op   dumps {:8.2f} us/op'.format(
+            codec, load_time / iterations * 1e6, dump_time / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
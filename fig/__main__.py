@@ -1,13 +1,19 @@
 from .falcon import FalconAPI, StreamManagementThread
 from .worker import WorkerThread
-from .queue import falcon_events
+from .queue import falcon_events, Checkpointer, CheckpointStore, SegmentSpool
 from .config import config
 from .backends import Backends
 from .falcon_data import FalconCache
 from .log import log
+from .util.scheduler import scheduler
 from . import __version__
 
 
+def log_metrics(cache, manager, enabled_backends):
+    log.info("Metrics: queue=%s, stream=%s, backends=%s, falcon_api=%s, cache=%s", falcon_events.stats(),
+             manager.stats(), enabled_backends.stats(), FalconAPI.shared().rate_limiter.stats(), cache.stats())
+
+
 if __name__ == "__main__":
     log.info("Starting Falcon Integration Gateway %s", __version__)
 
@@ -16,10 +22,29 @@ if __name__ == "__main__":
 
     config.validate()
 
-    falcon_cache = FalconCache(FalconAPI())
+    checkpoint_path = config.get('events', 'checkpoint_path')
+    if checkpoint_path:
+        checkpoint_store = CheckpointStore(checkpoint_path)
+        falcon_events.restore_offsets(checkpoint_store.load())
+        log.info("Stream offsets are checkpointed to %s (restored: %s)", checkpoint_path, falcon_events.committed_offsets())
+        checkpointer = Checkpointer(falcon_events, checkpoint_store)
+        scheduler.call_every(int(config.get('events', 'checkpoint_interval')), checkpointer.flush)
+
+    spool_directory = config.get('main', 'spool_directory')
+    if spool_directory:
+        spool = SegmentSpool(spool_directory, int(config.get('main', 'spool_segment_size_mb')) * 1024 * 1024)
+        falcon_events.enable_spool(spool, int(config.get('main', 'spool_memory_threshold')))
+        log.info("Events exceeding the in-memory queue are spooled to %s", spool_directory)
+
+    falcon_cache = FalconCache(FalconAPI.shared())
     backends = Backends()
 
-    StreamManagementThread(output_queue=falcon_events, relevant_event_types=backends.relevant_event_types).start()
+    stream_manager = StreamManagementThread(output_queue=falcon_events, relevant_event_types=backends.relevant_event_types)
+    stream_manager.start()
+
+    metrics_interval = int(config.get('main', 'metrics_interval'))
+    if metrics_interval:
+        scheduler.call_every(metrics_interval, log_metrics, falcon_cache, stream_manager, backends)
 
     for i in range(int(config.get('main', 'worker_threads'))):
         WorkerThread(name='worker-' + str(i),
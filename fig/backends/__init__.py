@@ -5,6 +5,8 @@ from . import gcp
 from . import workspaceone
 from . import cloudtrail_lake
 from . import generic
+from .delivery import Completion, DeliveryQueue
+from .routing import RoutingRule, RoutingRuleError
 from ..config import config
 from ..log import log
 
@@ -22,24 +24,64 @@ ALL_BACKENDS = {
 
 class Backends():
     def __init__(self):
-        self.runtimes = [v.Runtime()
-                         for k, v in ALL_BACKENDS.items()
-                         if k in config.backends]
+        self.names = [k for k in ALL_BACKENDS if k in config.backends]
+        self.runtimes = [ALL_BACKENDS[k].Runtime() for k in self.names]
         if len(self.runtimes) == 0:
             raise Exception("No Backend enabled. Exiting.")
 
+        self.routes = []
+        for name in self.names:
+            try:
+                rule = RoutingRule.from_config(name)
+            except RoutingRuleError as e:
+                raise Exception('Malformed configuration: routing.{}: {}'.format(name.lower(), e)) from e
+            if rule:
+                log.info("Events are routed to %s backend only when matching: %s", name, rule.definition)
+            self.routes.append(rule)
+
+        self.deliveries = [DeliveryQueue.from_config(name, runtime, self.is_relevant)
+                           for name, runtime in zip(self.names, self.runtimes)]
+
+        enriching = [n for n, r in zip(self.names, self.runtimes) if 'device_details' in r.ENRICHMENTS]
+        if not enriching:
+            log.info("None of the enabled backends requires device details, events will not be enriched")
+        elif config.detections_exclude_clouds:
+            log.info("Cloud based exclusion applies to backends that enrich events with device details: %s",
+                     ', '.join(enriching))
+
         accepted_types = self.relevant_event_types
         if accepted_types is None:
             log.info("At least one of the enabled backends will receive all the events")
         else:
             log.info("Enabled backends will only process events with types: %s", accepted_types)
 
-    def process(self, falcon_event):
-        for runtime in self.runtimes:
-            if self.event_type_is_accepted(runtime, falcon_event) and self.cloud_detection_is_relevant(falcon_event) and runtime.is_relevant(falcon_event):
-                runtime.process(falcon_event)
+    def process(self, falcon_event, on_done):
+        """Hand the event over to the delivery queues of the backends it is routed to.
+
+        on_done is called once all the backends are done with the event (immediately when there are none).
+        """
+        completion = Completion(on_done)
+        try:
+            # Routing rules only look at the event itself, evaluate them before anything that may need enrichment.
+            # Checks that may need enrichment run on the delivery threads of each backend.
+            for runtime, route, delivery in zip(self.runtimes, self.routes, self.deliveries):
+                if self.event_type_is_accepted(runtime, falcon_event) and route.matches(falcon_event.original_event):
+                    completion.add()
+                    delivery.submit(falcon_event, completion.done)
+        finally:
+            completion.done()
+
+    def is_relevant(self, runtime, falcon_event):
+        return self.cloud_detection_is_relevant(runtime, falcon_event) and runtime.is_relevant(falcon_event)
+
+    def stats(self):
+        return {delivery.name: delivery.stats() for delivery in self.deliveries}
 
-    def cloud_detection_is_relevant(self, falcon_event):
+    def cloud_detection_is_relevant(self, runtime, falcon_event):
+        # Cloud provider is known only after the device details are fetched. Skip the exclusion (and the
+        # Falcon API call) for backends that forward events without enriching them.
+        if not config.detections_exclude_clouds or 'device_details' not in runtime.ENRICHMENTS:
+            return True
         if falcon_event.original_event.event_type == 'EppDetectionSummaryEvent':
             if falcon_event.cloud_provider in config.detections_exclude_clouds or falcon_event.cloud_provider is None and 'unrecognized' in config.detections_exclude_clouds:
                 log.debug('A detection event is skipped based on cloud based exclusion')
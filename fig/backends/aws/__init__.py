@@ -1,11 +1,16 @@
 # pylint: disable=broad-except
 from datetime import datetime, timezone
+from functools import lru_cache, partial
 import logging
+import threading
 import traceback
-import boto3
 from botocore.exceptions import ClientError
 from ...config import config
 from ...log import log
+from ...util import jsoncodec
+from ..aws_clients import aws_clients
+from ..delivery import backend_batcher
+from .dedup import FindingIndex
 from ... import __version__
 
 # AWS Security Finding Format (ASFF) field length limits
@@ -32,9 +37,31 @@ def _truncate_field(value, max_length, field_name=None):
     return truncated
 
 
+def import_findings(region, findings):
+    """Import a batch of findings to Security Hub. Returns the request ID for each accepted finding."""
+    client = aws_clients.client('securityhub', region)
+    response = client.batch_import_findings(Findings=findings)
+    failed = {f['Id']: f for f in response.get('FailedFindings', [])}
+    request_id = response.get('ResponseMetadata', {}).get('RequestId', 'UNKNOWN')
+    return [
+        Exception('Security Hub rejected finding {}: {} {}'.format(
+            f['Id'], failed[f['Id']].get('ErrorCode'), failed[f['Id']].get('ErrorMessage')))
+        if f['Id'] in failed else request_id
+        for f in findings
+    ]
+
+
+@lru_cache
+def ec2_regions(region):
+    client = aws_clients.client('ec2', region)
+    return [region["RegionName"] for region in client.describe_regions()["Regions"]]
+
+
 class Submitter():
-    def __init__(self, event):
+    def __init__(self, event, importer, finding_index):
         self.event = event
+        self.importer = importer
+        self.finding_index = finding_index
         self.region = config.get('aws', 'region')
         self.confirm_instance = config.getboolean('aws', 'confirm_instance')
         self.accept_all_events = config.getboolean('aws', 'accept_all_events')
@@ -126,23 +153,17 @@ class Submitter():
     def find_instance(self, instance_id, mac_address):
         # Instance IDs are unique to the region, not the account, so we have to check them all
         report_region = self.region
-        ec2instance = None
-        ec2_client = boto3.client("ec2", region_name=report_region)
-        regions = [region["RegionName"] for region in ec2_client.describe_regions()["Regions"]]
-        for region in regions:
-            ec2 = boto3.resource("ec2", region_name=region)
+        det_mac = mac_address.lower().replace(":", "").replace("-", "")
+        for region in ec2_regions(report_region):
+            ec2 = aws_clients.client('ec2', region)
             try:
-                ec2instance = ec2.Instance(instance_id)
-                found = False
-                # Confirm the mac address matches
-                if ec2instance.network_interfaces:
-                    for iface in ec2instance.network_interfaces:
-                        det_mac = mac_address.lower().replace(":", "").replace("-", "")
-                        ins_mac = iface.mac_address.lower().replace(":", "").replace("-", "")
+                reservations = ec2.describe_instances(InstanceIds=[instance_id])["Reservations"]
+                for ec2instance in (i for r in reservations for i in r["Instances"]):
+                    # Confirm the mac address matches
+                    for iface in ec2instance.get("NetworkInterfaces", []):
+                        ins_mac = iface["MacAddress"].lower().replace(":", "").replace("-", "")
                         if det_mac == ins_mac:
-                            found = True
-                if found:  # pylint: disable=R1723
-                    return region, ec2instance
+                            return region, ec2instance
             except ClientError:
                 continue
             except Exception:  # pylint: disable=W0703
@@ -150,12 +171,15 @@ class Submitter():
                 log.exception(str(trace))
                 continue
 
-        return report_region, ec2instance
+        return report_region, None
 
-    @staticmethod
-    def send_to_securityhub(manifest, region):
-        client = boto3.client('securityhub', region_name=region)
-        check_response = {}
+    def finding_exists(self, manifest, region):
+        # Security Hub is only asked when the local index cannot tell
+        state = self.finding_index.lookup(manifest["Id"], float(self.event.event_create_time) / 1000.)
+        if state != FindingIndex.UNKNOWN:
+            return state == FindingIndex.EXISTS
+
+        client = aws_clients.client('securityhub', region)
         found = False
         try:
             check_response = client.get_findings(Filters={'Id': [{'Value': manifest["Id"], 'Comparison': 'EQUALS'}]})
@@ -163,16 +187,25 @@ class Submitter():
                 found = True
         except ClientError:
             pass
-
-        import_response = False
-        if not found:
-            try:
-                import_response = client.batch_import_findings(Findings=[manifest])
-            except ClientError as err:
-                # Boto3 issue communicating with SH, throw the error in the log
-                log.exception(str(err))
-
-        return import_response
+        if found:
+            self.finding_index.add(manifest["Id"])
+        return found
+
+    def send_to_securityhub(self, manifest, region):
+        """Queue the finding for import. Returns a Future resolved with the request ID once it is imported."""
+        future = self.importer(region).submit(manifest, len(jsoncodec.dumpb(manifest)))
+        future.add_done_callback(partial(self.imported, manifest))
+        return future
+
+    def imported(self, sh_payload, future):
+        if future.exception() is not None:
+            return
+        self.finding_index.add(sh_payload["Id"])
+        if log.level <= logging.DEBUG:
+            log.debug("Detection submitted to Security Hub. (Request ID: %s, Offset: %s). Payload info: %s",
+                      future.result(), self.event.original_event.offset, sh_payload)
+        else:
+            log.info("Detection submitted to Security Hub. (Request ID: %s, Offset: %s)", future.result(), self.event.original_event.offset)
 
     def submit(self):
         log.info("Processing detection: %s (Offset: %s)", self.event.detect_description, self.event.original_event.offset)
@@ -190,18 +223,9 @@ class Submitter():
                     if instance is None:
                         log.warning("Instance %s with MAC address %s not found in regions searched. Alert not processed.",
                                     self.event.instance_id, self.event.device_details["mac_address"])
-                        return
-                    try:
-                        if instance.network_interfaces:
-                            for _ in instance.network_interfaces:
-                                # Only send alerts for instances we can find
-                                send = True
-
-                    except ClientError:
-                        # Not our instance
-                        i_id = self.event.instance_id
-                        mac = self.event.device_details["mac_address"]
-                        log.info("Instance %s with MAC address %s not found in regions searched. Alert not processed.", i_id, mac)
+                        return None
+                    # Only send alerts for instances we can find
+                    send = True
             except AttributeError:
                 # Instance ID was not provided by the detection
                 log.info("Instance ID not provided by detection. Alert not processed.")
@@ -211,42 +235,18 @@ class Submitter():
 
         if send:
             sh_payload = self.create_payload(det_region)
-            response = self.send_to_securityhub(sh_payload, det_region)
-            if not response:
+            if self.finding_exists(sh_payload, det_region):
                 if log.level <= logging.DEBUG:
                     log.debug("Detection already submitted to Security Hub. Alert not processed. (Offset: %s). Payload info: %s", self.event.original_event.offset, sh_payload)
                 else:
                     log.info("Detection already submitted to Security Hub. Alert not processed. (Offset: %s)", self.event.original_event.offset)
-            else:
-                try:
-                    success_count = response.get("SuccessCount", 0)
-
-                    if success_count > 0:
-                        try:
-                            request_id = response.get('ResponseMetadata', {}).get('RequestId', 'UNKNOWN')
-                            if log.level <= logging.DEBUG:
-                                log.debug("Detection submitted to Security Hub. (Request ID: %s, Offset: %s). Payload info: %s",
-                                          request_id, self.event.original_event.offset, sh_payload)
-                            else:
-                                log.info("Detection submitted to Security Hub. (Request ID: %s, Offset: %s)", request_id, self.event.original_event.offset)
-                        except Exception as e:
-                            log.error("Error accessing response metadata: %s", str(e))
-                            log.info("Detection submitted to Security Hub (Request ID unavailable due to error, Offset: %s)", self.event.original_event.offset)
-                    else:
-                        log.warning("SuccessCount is 0 or missing - submission may have failed (Offset: %s)", self.event.original_event.offset)
-                        log.debug("Full response for debugging (Offset: %s): %s", self.event.original_event.offset, response)
-                except Exception as e:
-                    log.error("Error processing Security Hub response: %s (Offset: %s)", str(e), self.event.original_event.offset)
-                    log.exception("Response processing exception details:")
-                    log.debug("Raw response that caused error (Offset: %s): %s", self.event.original_event.offset, response)
+                return None
+            return self.send_to_securityhub(sh_payload, det_region)
+        return None
 
     def create_payload(self, instance_region):  # pylint: disable=too-many-locals
         region = self.region
-        try:
-            account_id = boto3.client("sts", region_name=region).get_caller_identity().get('Account')
-        except KeyError:
-            # Failed to get endpoint_resolver the first time, try it again
-            account_id = boto3.client("sts", region_name=region).get_caller_identity().get('Account')
+        account_id = aws_clients.account_id(region)
         severity_original = self.event.severity
         severity_label = severity_original.upper()
         if "gov" in region:
@@ -420,16 +420,31 @@ class Submitter():
 
 class Runtime():
     RELEVANT_EVENT_TYPES = ['EppDetectionSummaryEvent']
+    ENRICHMENTS = ('device_details',)
+    # Limits of BatchImportFindings
+    MAX_BATCH_FINDINGS = 100
+    MAX_BATCH_BYTES = 5 * 1024 * 1024
 
     def __init__(self):
         log.info("AWS Backend is enabled.")
         self.accept_all_events = config.getboolean('aws', 'accept_all_events')
+        self._importers = {}
+        self._importers_lock = threading.Lock()
+        self.finding_index = FindingIndex.from_config()
 
     def is_relevant(self, falcon_event):
         return self.accept_all_events or (falcon_event.cloud_provider is not None and falcon_event.cloud_provider[:3].upper() == 'AWS')
 
     def process(self, falcon_event):
-        Submitter(falcon_event).submit()
+        return Submitter(falcon_event, self.importer, self.finding_index).submit()
+
+    def importer(self, region):
+        # Findings are imported to the region of the instance, hence one batcher per region
+        with self._importers_lock:
+            if region not in self._importers:
+                self._importers[region] = backend_batcher('AWS', partial(import_findings, region),
+                                                          self.MAX_BATCH_FINDINGS, self.MAX_BATCH_BYTES)
+            return self._importers[region]
 
 
 __all__ = ['Runtime']
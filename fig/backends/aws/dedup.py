@@ -0,0 +1,53 @@
+import time
+from ...config import config
+from ...util.cache import CacheStore, TTLCache
+
+
+class FindingIndex():
+    """Ids of findings known to exist in Security Hub, consulted before importing a finding.
+
+    Ids imported (or found in Security Hub) are kept in a bounded TTLCache. lookup() returns:
+
+        EXISTS   the finding is known to exist, there is no need to import it
+        UNKNOWN  the finding may exist, Security Hub has to be asked
+        NEW      the finding cannot have been imported by the gateway, it can be imported right away
+
+    A miss is only conclusive when the index is persisted (cache.path) and has been recording since before the
+    detection was created, and the detection is younger than the index TTL. Otherwise (fresh index, replayed or
+    old detections, in-memory index) Security Hub is asked.
+    """
+    NEW = 'new'
+    UNKNOWN = 'unknown'
+    EXISTS = 'exists'
+    # Far expiration of the entry recording since when the index is complete
+    SINCE_TTL = 100 * 365 * 24 * 60 * 60
+
+    def __init__(self, size, ttl, store=None):
+        self.ttl = ttl
+        self._exact = TTLCache('securityhub_findings', size, ttl, ttl, store)
+        self.since = None
+        if store is not None:
+            entry = store.load('securityhub_findings_index', 'since')
+            if entry is None:
+                self.since = time.time()
+                store.save('securityhub_findings_index', 'since', self.since, self.since + self.SINCE_TTL)
+            else:
+                self.since = entry[0]
+
+    @classmethod
+    def from_config(cls):
+        path = config.get('cache', 'path')
+        return cls(int(config.get('aws', 'finding_index_size')),
+                   int(config.get('aws', 'finding_index_ttl')),
+                   CacheStore.shared(path) if path else None)
+
+    def lookup(self, finding_id, created_at):
+        """Look up finding of a detection created at `created_at` (epoch seconds)"""
+        if finding_id in self._exact:
+            return self.EXISTS
+        if self.since is None or created_at < self.since or created_at <= time.time() - self.ttl:
+            return self.UNKNOWN
+        return self.NEW
+
+    def add(self, finding_id):
+        self._exact.put(finding_id, True)
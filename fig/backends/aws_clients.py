@@ -0,0 +1,65 @@
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError
+from ..config import config
+from ..util.cache import TTLCache
+
+
+class ClientPool():
+    """boto3 clients shared by all threads, one per service and region.
+
+    Creating a client loads the service model and opens new connections, so clients are created once and reused.
+    Clients are thread-safe, while boto3 sessions and resources are not: clients are created from a dedicated
+    session under a lock, and no resources are handed out. The connection pool of each client is sized to the
+    number of threads that may call it concurrently.
+    """
+    IDENTITY_TTL = 12 * 60 * 60
+
+    def __init__(self):
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._identities = TTLCache('aws_identities', 16, self.IDENTITY_TTL, 0)
+
+    def client(self, service, region):
+        key = (service, region)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._create(service, region)
+        return client
+
+    def account_id(self, region):
+        """Return the account the clients are signed for.
+
+        The caller identity is resolved once per credential set, keyed by access key, so STS is only asked again
+        once the credentials rotate.
+        """
+        with self._lock:
+            credentials = self._get_session().get_credentials()
+        if credentials is None:
+            raise NoCredentialsError()
+        access_key = credentials.get_frozen_credentials().access_key
+        return self._identities.get_or_load(
+            access_key, lambda: self.client('sts', region).get_caller_identity()['Account'])
+
+    def _create(self, service, region):
+        return self._get_session().client(service, region_name=region,
+                                          config=Config(max_pool_connections=self.pool_size()))
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session
+
+    @staticmethod
+    def pool_size():
+        # Clients are called by delivery threads (including batch flushes) and by workers
+        threads = [config.delivery_threads(backend) for backend in config.backends if backend] or [1]
+        return max(10, int(config.get('main', 'worker_threads')) + max(threads))
+
+
+aws_clients = ClientPool()
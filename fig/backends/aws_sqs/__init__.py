@@ -1,34 +1,48 @@
-import json
 from functools import lru_cache
-import boto3
 from botocore.exceptions import ClientError
 from ...config import config
 from ...log import log
+from ..aws_clients import aws_clients
+from ..delivery import backend_batcher
 
 
 class Submitter():
+    # Limits of SendMessageBatch
+    MAX_BATCH_MESSAGES = 10
+    MAX_BATCH_BYTES = 256 * 1024
+
     def __init__(self):
         aws_region = config.get('aws_sqs', 'region')
         log.debug("Attempting to connect to AWS (region %s) SQS: %s", aws_region, self.sqs_queue_name)
         try:
-            aws_client = boto3.resource('sqs', region_name=aws_region)
-            self.queue = aws_client.get_queue_by_name(QueueName=self.sqs_queue_name)
+            self.client = aws_clients.client('sqs', aws_region)
+            self.queue_url = self.client.get_queue_url(QueueName=self.sqs_queue_name)['QueueUrl']
         except ClientError:  # pylint: disable=W0703
             log.exception("Cannot configure AWS SQS Queue: %s in %s", aws_region, self.sqs_queue_name)
-            self.queue = None
+            self.queue_url = None
             raise
+        self.batcher = backend_batcher('AWS_SQS', self.send_batch, self.MAX_BATCH_MESSAGES, self.MAX_BATCH_BYTES)
 
     def submit(self, event):
+        """Queue the event for sending. Returns a Future resolved once the message is accepted by SQS."""
         eoe = event.original_event
+        message = {'MessageBody': event.original_json}
         if self.is_fifo:
             feed_id = getattr(eoe, 'feed_id') if hasattr(eoe, 'feed_id') else 0
-            self.queue.send_message(
-                MessageGroupId="fig/%s/%s" % (self.app_id, feed_id),
-                MessageDeduplicationId=str(eoe.offset),
-                MessageBody=json.dumps(eoe)
-            )
-        else:
-            self.queue.send_message(MessageBody=json.dumps(eoe))
+            message['MessageGroupId'] = "fig/%s/%s" % (self.app_id, feed_id)
+            message['MessageDeduplicationId'] = str(eoe.offset)
+        return self.batcher.submit(message, len(message['MessageBody'].encode('utf-8')))
+
+    def send_batch(self, messages):
+        response = self.client.send_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[dict(message, Id=str(i)) for i, message in enumerate(messages)]
+        )
+        results = [None] * len(messages)
+        for failed in response.get('Failed', []):
+            results[int(failed['Id'])] = Exception('Cannot send message to SQS queue {}: {} {}'.format(
+                self.sqs_queue_name, failed.get('Code'), failed.get('Message')))
+        return results
 
     @property
     @lru_cache
@@ -48,6 +62,7 @@ class Submitter():
 
 class Runtime():
     RELEVANT_EVENT_TYPES = "ALL"
+    ENRICHMENTS = ()
 
     def __init__(self):
         log.info("AWS SQS Backend is enabled.")
@@ -57,7 +72,7 @@ class Runtime():
         return True
 
     def process(self, falcon_event):
-        self.submitter.submit(falcon_event)
+        return self.submitter.submit(falcon_event)
 
 
 __all__ = ['Runtime']
@@ -1,7 +1,6 @@
 from base64 import b64decode, b64encode
 from hashlib import sha256
 from datetime import datetime
-from json import dumps
 from hmac import new
 from requests import post
 from azure.monitor.ingestion import LogsIngestionClient
@@ -9,18 +8,30 @@ from azure.identity import ClientSecretCredential, DefaultAzureCredential
 from azure.core.exceptions import ClientAuthenticationError, HttpResponseError
 from ...log import log
 from ...config import config
+from ...util import jsoncodec
 from ...falcon.errors import RTRConnectionError
+from ..delivery import backend_batcher
 
 STREAM_NAME = 'Custom-FalconIntegrationGatewayLogs'
 
 
 def post_data(client, dcr_immutable_id, body):
+    """Upload logs to Log Analytics. Returns the logs that could not be uploaded."""
+    failed = []
+
+    def on_error(error):
+        log.error("Failed to send detection to Log Analytics: %s", error.error)
+        failed.extend(error.failed_logs)
+
     try:
-        client.upload(dcr_immutable_id, STREAM_NAME, body)
+        client.upload(dcr_immutable_id, STREAM_NAME, body, on_error=on_error)
     except ClientAuthenticationError as e:
         log.error("Azure authentication failed sending detection to Log Analytics: %s", e)
+        return body
     except HttpResponseError as e:
         log.error("Failed to send detection to Log Analytics: %s", e)
+        return body
+    return failed
 
 
 def build_signature(workspace_id, primary_key, date, content_length, method, content_type, resource):
@@ -34,7 +45,7 @@ def build_signature(workspace_id, primary_key, date, content_length, method, con
 
 
 def post_data_legacy(workspace_id, primary_key, body, log_type):
-    body = dumps(body, ensure_ascii=False).encode('utf-8')
+    body = jsoncodec.dumpb(body)
     method = 'POST'
     content_type = 'application/json'
     resource = '/api/logs'
@@ -52,18 +63,16 @@ def post_data_legacy(workspace_id, primary_key, body, log_type):
     response = post(uri, data=body, headers=headers, timeout=60)
     if (response.status_code < 200 or response.status_code > 299):
         log.error("Failed to send detection to Log Analytics: %s", response.text)
+        return False
+    return True
 
 
 class Submitter():
     AZURE_ARC_KEYS = ['resourceName', 'resourceGroup', 'subscriptionId', 'tenantId', 'vmId']
 
-    def __init__(self, event, ingestion_client=None, dcr_immutable_id=None,
-                 workspace_id=None, primary_key=None):
+    def __init__(self, event, batcher):
         self.event = event
-        self.ingestion_client = ingestion_client
-        self.dcr_immutable_id = dcr_immutable_id
-        self.workspace_id = workspace_id
-        self.primary_key = primary_key
+        self.batcher = batcher
         self.azure_arc_config = self.autodiscovery()
 
     def autodiscovery(self):
@@ -109,11 +118,10 @@ class Submitter():
                 }
 
     def submit(self):
+        """Queue the detection for upload. Returns a Future resolved once it is uploaded."""
         log.info("Processing detection: %s", self.event.detect_description)
-        if self.ingestion_client is not None:
-            post_data(self.ingestion_client, self.dcr_immutable_id, self.log())
-        else:
-            post_data_legacy(self.workspace_id, self.primary_key, self.log(), 'FalconIntegrationGatewayLogs')
+        entry = self.log()[0]
+        return self.batcher.submit(entry, len(jsoncodec.dumpb(entry)))
 
     def log(self):
         json_data = [{
@@ -145,6 +153,9 @@ class Submitter():
 
 class Runtime():
     RELEVANT_EVENT_TYPES = ['EppDetectionSummaryEvent']
+    ENRICHMENTS = ('device_details', 'azure_arc_config')
+    MAX_BATCH_LOGS = 500
+    MAX_BATCH_BYTES = 1024 * 1024
 
     def __init__(self):
         auth_method = config.get('azure', 'auth_method')
@@ -180,18 +191,23 @@ class Runtime():
             self._dcr_immutable_id = None
             self._workspace_id = config.get('azure', 'workspace_id')
             self._primary_key = config.get('azure', 'primary_key')
+        self._batcher = backend_batcher('AZURE', self.upload, self.MAX_BATCH_LOGS, self.MAX_BATCH_BYTES)
 
     def is_relevant(self, falcon_event):
         return True
 
     def process(self, falcon_event):
-        Submitter(
-            falcon_event,
-            ingestion_client=self._ingestion_client,
-            dcr_immutable_id=self._dcr_immutable_id,
-            workspace_id=self._workspace_id,
-            primary_key=self._primary_key,
-        ).submit()
+        return Submitter(falcon_event, self._batcher).submit()
+
+    def upload(self, logs):
+        if self._ingestion_client is not None:
+            failed = {id(entry) for entry in post_data(self._ingestion_client, self._dcr_immutable_id, logs)}
+        elif post_data_legacy(self._workspace_id, self._primary_key, logs, 'FalconIntegrationGatewayLogs'):
+            failed = set()
+        else:
+            failed = {id(entry) for entry in logs}
+        error = Exception('Failed to send detection to Log Analytics')
+        return [error if id(entry) in failed else None for entry in logs]
 
 
 __all__ = ['Runtime']
@@ -1,16 +1,15 @@
-from json import dumps
-import boto3
-from botocore.exceptions import ClientError
 from ...config import config
 from ...log import log
+from ...util import jsoncodec
+from ..aws_clients import aws_clients
+from ..delivery import backend_batcher
 from .cloudtrail_offset import LastEventOffset
 
 
 class Submitter():
-    def __init__(self, event, channel_arn, region, account_id, last_event_offset):
+    def __init__(self, event, batcher, account_id, last_event_offset):
         self.event = event
-        self.channel_arn = channel_arn
-        self.region = region
+        self.batcher = batcher
         self.account_id = account_id
         self.last_event_offset = last_event_offset
 
@@ -43,61 +42,53 @@ class Submitter():
             "UID": uid,
             "sourceIPAddress": event['UserIp'],
             "recipientAccountId": self.account_id,
-            "additionalEventData": {
-                "raw": self.event.original_event
-            }
         }
 
         return event_data
 
-    def send_to_cloudtraillake(self, event_data):
+    def audit_event_json(self, event_data):
         '''
-        Sends the event to CloudTrail Lake. Returns the response.
+        Encode the audit event. The original event is embedded as additionalEventData.raw using its shared
+        encoding instead of being serialized again.
         '''
-        client = boto3.client('cloudtrail-data', region_name=self.region)
-        response = False
-        try:
-            response = client.put_audit_events(
-                auditEvents=[
-                    {
-                        'id': event_data['UID'],
-                        'eventData': dumps(event_data)
-                    }
-                ],
-                channelArn=self.channel_arn
-            )
-        except ClientError as err:
-            log.exception(str(err))
-
-        return response
+        return jsoncodec.dumps_with_fragments(event_data, {
+            "additionalEventData": '{"raw":' + self.event.original_json + '}'
+        })
 
     def submit(self):
         '''
-        Submit events to CloudTrail Lake and updates the last seen offset.
+        Queue the event for submission to CloudTrail Lake. Returns a Future resolved once the event is accepted;
+        the last seen offset is updated then.
         '''
         operation_name = self.event.original_event['event']['OperationName']
         uid = self.event.original_event.uid
         log.info("Processing user activity event: %s ID: %s", operation_name, uid)
 
         event_data = self.cloudtrail_lake_audit_event()
-        response = self.send_to_cloudtraillake(event_data)
-
-        # Check response for errors
-        if not response:
-            log.error("Exception Error occured while sending event to CloudTrail Lake.")
-        else:
-            if response['failed']:
-                log.error("Failed Response recieved for: %s", response['failed'])
-            else:
-                log.info("Successfully sent event ID: %s to CloudTrail Lake. (Request ID: %s)",
-                         uid, response['ResponseMetadata']['RequestId'])
-                # Update the last seen offset for this feed
-                self.last_event_offset.update_last_seen_offsets(self.event.original_event.feed_id,
-                                                                self.event.original_event.offset)
+        audit_event = {
+            'id': event_data['UID'],
+            'eventData': self.audit_event_json(event_data)
+        }
+        future = self.batcher.submit(audit_event, len(audit_event['eventData'].encode('utf-8')))
+        future.add_done_callback(self.submitted)
+        return future
+
+    def submitted(self, future):
+        if future.exception() is not None:
+            return
+        log.info("Successfully sent event ID: %s to CloudTrail Lake. (Request ID: %s)",
+                 self.event.original_event.uid, future.result())
+        # Update the last seen offset for this feed
+        self.last_event_offset.update_last_seen_offsets(self.event.original_event.feed_id,
+                                                        self.event.original_event.offset)
 
 
 class Runtime():
     RELEVANT_EVENT_TYPES = ['AuthActivityAuditEvent']
+    ENRICHMENTS = ()
+    # Limits of PutAuditEvents
+    MAX_BATCH_EVENTS = 100
+    MAX_BATCH_BYTES = 1024 * 1024
 
     def __init__(self):
         log.info("AWS CloudTrail Lake Backend is enabled.")
@@ -114,6 +105,8 @@ class Runtime():
         self.last_event_offset = LastEventOffset()
         # Get the last seen offset for each feed
         self.last_seen_offsets = self.last_event_offset.get_last_seen_offsets()
+        self.batcher = backend_batcher('CLOUDTRAIL_LAKE', self.send_to_cloudtraillake,
+                                       self.MAX_BATCH_EVENTS, self.MAX_BATCH_BYTES)
 
     def is_relevant(self, falcon_event):
         if falcon_event.service_name.lower() != "crowdstrike authentication":
@@ -126,7 +119,20 @@ class Runtime():
         return False
 
     def process(self, falcon_event):
-        Submitter(falcon_event, self.channel_arn, self.region, self.account_id, self.last_event_offset).submit()
+        return Submitter(falcon_event, self.batcher, self.account_id, self.last_event_offset).submit()
+
+    def send_to_cloudtraillake(self, audit_events):
+        '''
+        Sends a batch of audit events to CloudTrail Lake. Returns the request ID for each accepted event.
+        '''
+        client = aws_clients.client('cloudtrail-data', self.region)
+        response = client.put_audit_events(auditEvents=audit_events, channelArn=self.channel_arn)
+        failed = {f['id']: f for f in response.get('failed', [])}
+        request_id = response['ResponseMetadata']['RequestId']
+        return [
+            Exception('Failed Response recieved for: {}'.format(failed[e['id']])) if e['id'] in failed else request_id
+            for e in audit_events
+        ]
 
 
 __all__ = ['Runtime']
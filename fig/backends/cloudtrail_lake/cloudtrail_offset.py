@@ -1,9 +1,9 @@
 import ast
 import threading
-import boto3
 from botocore.exceptions import ClientError
 from ...config import config
 from ...log import log
+from ..aws_clients import aws_clients
 
 
 _offset_lock = threading.RLock()
@@ -18,7 +18,7 @@ class LastEventOffset():
     def __init__(self):
         self.last_seen_offsets = {}
         self.param_name = 'last_seen_offsets'
-        self.client = boto3.client('ssm', region_name=config.get('cloudtrail_lake', 'region'))
+        self.client = aws_clients.client('ssm', config.get('cloudtrail_lake', 'region'))
         self.validate_ssm_parameter()
         self.cache = None
 
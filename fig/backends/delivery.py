@@ -0,0 +1,111 @@
+import queue
+import threading
+from concurrent.futures import Future
+from functools import partial
+from ..config import config
+from ..falcon_data import EventDataError
+from ..log import log
+from ..util.batching import Batcher
+
+
+def backend_batcher(backend, flush, max_items, max_bytes=None):
+    """Batcher for submissions of a backend, flushed by as many threads as the backend delivers events with"""
+    return Batcher(backend.lower(), flush, max_items, max_bytes,
+                   linger=int(config.get('delivery', 'batch_linger_ms')) / 1000.0,
+                   threads=config.delivery_threads(backend))
+
+
+class Completion():
+    """Call `callback` once every party holding a reference has called done().
+
+    The creator holds the first reference; add() takes another one for each party the work is handed to.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self._pending += 1
+
+    def done(self):
+        with self._lock:
+            self._pending -= 1
+            finished = self._pending == 0
+        if finished:
+            self.callback()
+
+
+class DeliveryQueue():
+    """Bounded queue of events with a pool of threads delivering them to one backend.
+
+    Each backend has its own queue, so a slow backend only holds back its own deliveries until its queue fills
+    up. Relevance checks that may need enrichment (cloud exclusion, Runtime.is_relevant) run on the delivery
+    threads as well. Runtime.process may return a Future; the delivery is then complete once the future is.
+    """
+
+    def __init__(self, name, runtime, is_relevant, threads, maxsize):
+        self.name = name
+        self.runtime = runtime
+        self.is_relevant = is_relevant
+        self.queue = queue.Queue(maxsize)
+        self.processed = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+        for i in range(threads):
+            threading.Thread(target=self._run, name='{}-{}'.format(name.lower(), i), daemon=True).start()
+
+    @classmethod
+    def from_config(cls, name, runtime, is_relevant):
+        return cls(name, runtime, is_relevant, config.delivery_threads(name), int(config.get('delivery', 'queue_size')))
+
+    def submit(self, falcon_event, on_done):
+        self.queue.put((falcon_event, on_done))
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queued': self.queue.qsize(),
+                'processed': self.processed,
+                'failed': self.failed,
+            }
+
+    def _run(self):
+        while True:
+            falcon_event, on_done = self.queue.get()
+            try:
+                result = self._deliver(falcon_event)
+            except EventDataError:
+                log.exception("Could not translate falcon event to cloud provider")
+                self._finished(on_done, False)
+                continue
+            except Exception:  # pylint: disable=W0703
+                log.exception("Error occurred while delivering event %s to %s backend", falcon_event.original_event.uid, self.name)
+                self._finished(on_done, False)
+                continue
+
+            if isinstance(result, Future):
+                result.add_done_callback(partial(self._future_done, falcon_event, on_done))
+            else:
+                self._finished(on_done, True)
+
+    def _deliver(self, falcon_event):
+        if not self.is_relevant(self.runtime, falcon_event):
+            return None
+        return self.runtime.process(falcon_event)
+
+    def _future_done(self, falcon_event, on_done, future):
+        error = future.exception()
+        if error is not None:
+            log.error("Error occurred while delivering event %s to %s backend: %s", falcon_event.original_event.uid, self.name, error)
+        self._finished(on_done, error is None)
+
+    def _finished(self, on_done, success):
+        with self._stats_lock:
+            if success:
+                self.processed += 1
+            else:
+                self.failed += 1
+        on_done()
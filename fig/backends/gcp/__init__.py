@@ -189,6 +189,7 @@ class Submitter():
 
 class Runtime():
     RELEVANT_EVENT_TYPES = ['EppDetectionSummaryEvent']
+    ENRICHMENTS = ('device_details',)
 
     def __init__(self):
         log.info("GCP Backend is enabled.")
@@ -3,6 +3,8 @@ from ...config import config
 
 
 class Runtime():
+    ENRICHMENTS = ()
+
     @property
     def RELEVANT_EVENT_TYPES(self):
         """
@@ -37,7 +39,7 @@ class Runtime():
 
     def process(self, falcon_event):
         # Used to display falcon_events in the console
-        log.info(falcon_event.original_event)
+        log.info(falcon_event.original_json)
 
 
 __all__ = ['Runtime']
@@ -0,0 +1,77 @@
+import re
+import fnmatch
+from ..config import config
+
+
+class RoutingRuleError(Exception):
+    pass
+
+
+class RoutingRule():
+    """Conditions an event has to meet to be routed to a backend.
+
+    The rule is configured in the [routing] section of the configuration, with one option per backend. Conditions
+    are separated by semicolon and all of them have to match. Each condition has a form <field> <operator> <value>,
+    where field is a dotted path within the original event (e.g. event.Tactic or metadata.customerIDString) and
+    operator is one of:
+
+        ==, !=          value equals (does not equal)
+        in, not in      value is (is not) one of comma separated values
+        ~, !~           value matches (does not match) shell-style wildcard pattern, case-insensitive
+
+    Only fields of the event itself are available, so the rule is evaluated before any enrichment takes place.
+    """
+    CONDITION_RE = re.compile(r'^\s*([\w.]+)\s+(==|!=|not in|in|!~|~)\s+(.*?)\s*$')
+
+    def __init__(self, definition):
+        self.definition = definition
+        self.predicates = [self.compile(c) for c in definition.split(';') if c.strip()]
+
+    @classmethod
+    def from_config(cls, backend):
+        return cls(config.get('routing', backend.lower(), fallback=''))
+
+    def matches(self, event):
+        for predicate in self.predicates:
+            if not predicate(event):
+                return False
+        return True
+
+    def __bool__(self):
+        return len(self.predicates) > 0
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.definition)
+
+    @classmethod
+    def compile(cls, condition):
+        match = cls.CONDITION_RE.match(condition)
+        if not match:
+            raise RoutingRuleError('Cannot parse routing condition: {}'.format(condition))
+        path, operator, value = match.groups()
+        path = path.split('.')
+
+        if operator in ('==', '!='):
+            test = value.__eq__
+        elif operator in ('in', 'not in'):
+            test = frozenset(v.strip() for v in value.split(',')).__contains__
+        else:
+            test = re.compile(fnmatch.translate(value), re.IGNORECASE).match
+
+        negate = operator in ('!=', 'not in', '!~')
+
+        def predicate(event):
+            field = cls.lookup(event, path)
+            if field is None:
+                return negate
+            return bool(test(str(field))) != negate
+        return predicate
+
+    @staticmethod
+    def lookup(event, path):
+        value = event
+        for key in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
@@ -68,6 +68,7 @@ class Submitter():
 
 class Runtime():
     RELEVANT_EVENT_TYPES = ['EppDetectionSummaryEvent']
+    ENRICHMENTS = ('device_details', 'mdm_identifier')
 
     def __init__(self):
         log.info("Workspace One backend is enabled.")
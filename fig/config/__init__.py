@@ -12,16 +12,32 @@ class FigConfig(configparser.ConfigParser):
     ENV_DEFAULTS = [
         ['main', 'backends', 'FIG_BACKENDS'],
         ['main', 'worker_threads', 'FIG_WORKER_THREADS'],
+        ['main', 'queue_max_size', 'FIG_QUEUE_MAX_SIZE'],
+        ['main', 'spool_directory', 'FIG_SPOOL_DIRECTORY'],
+        ['main', 'spool_memory_threshold', 'FIG_SPOOL_MEMORY_THRESHOLD'],
+        ['main', 'spool_segment_size_mb', 'FIG_SPOOL_SEGMENT_SIZE_MB'],
+        ['main', 'metrics_interval', 'FIG_METRICS_INTERVAL'],
+        ['main', 'json_codec', 'FIG_JSON_CODEC'],
+        ['delivery', 'threads', 'DELIVERY_THREADS'],
+        ['delivery', 'queue_size', 'DELIVERY_QUEUE_SIZE'],
         ['logging', 'level', 'LOG_LEVEL'],
         ['events', 'severity_threshold', 'EVENTS_SEVERITY_THRESHOLD'],
         ['events', 'older_than_days_threshold', 'EVENTS_OLDER_THAN_DAYS_THRESHOLD'],
         ['events', 'offset', 'EVENTS_OFFSET'],
         ['events', 'start_from_newest', 'EVENTS_START_FROM_NEWEST'],
+        ['events', 'checkpoint_path', 'EVENTS_CHECKPOINT_PATH'],
+        ['events', 'checkpoint_interval', 'EVENTS_CHECKPOINT_INTERVAL'],
         ['falcon', 'cloud_region', 'FALCON_CLOUD_REGION'],
         ['falcon', 'client_id', 'FALCON_CLIENT_ID'],
         ['falcon', 'client_secret', 'FALCON_CLIENT_SECRET'],
         ['falcon', 'reconnect_retry_count', 'FALCON_RECONNECT_RETRY_COUNT'],
         ['falcon', 'application_id', 'FALCON_APPLICATION_ID'],
+        ['cache', 'max_entries', 'CACHE_MAX_ENTRIES'],
+        ['cache', 'path', 'CACHE_PATH'],
+        ['cache', 'device_ttl', 'CACHE_DEVICE_TTL'],
+        ['cache', 'rtr_ttl', 'CACHE_RTR_TTL'],
+        ['cache', 'negative_ttl', 'CACHE_NEGATIVE_TTL'],
+        ['cache', 'rtr_negative_ttl', 'CACHE_RTR_NEGATIVE_TTL'],
         ['credentials_store', 'store', 'CREDENTIALS_STORE'],
         ['ssm', 'region', 'SSM_REGION'],
         ['ssm', 'ssm_client_id', 'SSM_CLIENT_ID'],
@@ -150,18 +166,73 @@ class FigConfig(configparser.ConfigParser):
 
         if int(self.get('main', 'worker_threads')) not in range(1, 128):
             raise Exception('Malformed configuration: expected main.worker_threads to be in range 1-128')
+        if int(self.get('main', 'metrics_interval')) not in range(0, 86401):
+            raise Exception('Malformed configuration: expected main.metrics_interval to be in range 0-86400')
+        if self.get('main', 'json_codec') not in ['', 'json', 'orjson', 'ujson']:
+            raise Exception('Malformed configuration: expected main.json_codec to be one of: json, orjson, ujson')
+        if self.queue_max_size() not in range(0, 10000001):
+            raise Exception('Malformed configuration: expected main.queue_max_size to be in range 0-10000000')
+        if self.get('main', 'spool_directory'):
+            threshold = int(self.get('main', 'spool_memory_threshold'))
+            if threshold not in range(1, 10000001):
+                raise Exception('Malformed configuration: expected main.spool_memory_threshold to be in range 1-10000000')
+            if 0 < self.queue_max_size() <= threshold:
+                raise Exception('Malformed configuration: expected main.queue_max_size to be either 0 or greater than '
+                                'main.spool_memory_threshold when main.spool_directory is configured')
+            if int(self.get('main', 'spool_segment_size_mb')) not in range(1, 4096):
+                raise Exception('Malformed configuration: expected main.spool_segment_size_mb to be in range 1-4095')
         self.validate_falcon()
+        self.validate_cache()
+        self.validate_delivery()
         self.validate_events()
         self.validate_backends()
 
     def validate_falcon(self):
         if int(self.get('falcon', 'reconnect_retry_count')) not in range(1, 10000):
             raise Exception('Malformed configuration: expected falcon.reconnect_retry_count to be in range 0-10000')
+        if int(self.get('falcon', 'stream_read_timeout')) not in range(1, 3601):
+            raise Exception('Malformed configuration: expected falcon.stream_read_timeout to be in range 1-3600')
+        if int(self.get('falcon', 'stream_stall_timeout')) not in range(10, 3601):
+            raise Exception('Malformed configuration: expected falcon.stream_stall_timeout to be in range 10-3600')
+        if int(self.get('falcon', 'api_rate_limit')) not in range(1, 1000001):
+            raise Exception('Malformed configuration: expected falcon.api_rate_limit to be in range 1-1000000')
+        if int(self.get('falcon', 'api_max_retries')) not in range(0, 101):
+            raise Exception('Malformed configuration: expected falcon.api_max_retries to be in range 0-100')
+        if int(self.get('falcon', 'rtr_command_timeout')) not in range(1, 3601):
+            raise Exception('Malformed configuration: expected falcon.rtr_command_timeout to be in range 1-3600')
+        if int(self.get('falcon', 'rtr_batch_size')) not in range(1, 10001):
+            raise Exception('Malformed configuration: expected falcon.rtr_batch_size to be in range 1-10000')
+        if int(self.get('falcon', 'rtr_batch_window_ms')) not in range(0, 60001):
+            raise Exception('Malformed configuration: expected falcon.rtr_batch_window_ms to be in range 0-60000')
+        # GetDeviceDetailsV2 accepts at most 100 ids per request
+        if int(self.get('falcon', 'device_details_batch_size')) not in range(1, 101):
+            raise Exception('Malformed configuration: expected falcon.device_details_batch_size to be in range 1-100')
+        if int(self.get('falcon', 'device_details_batch_window_ms')) not in range(0, 10001):
+            raise Exception('Malformed configuration: expected falcon.device_details_batch_window_ms to be in range 0-10000')
         if self.get('falcon', 'cloud_region') not in self.FALCON_CLOUD_REGIONS:
             raise Exception(
                 'Malformed configuration: expected falcon.cloud_region to be in {}'.format(self.FALCON_CLOUD_REGIONS)
             )
 
+    def validate_cache(self):
+        if int(self.get('cache', 'max_entries')) not in range(1, 10000001):
+            raise Exception('Malformed configuration: expected cache.max_entries to be in range 1-10000000')
+        for option in ['device_ttl', 'rtr_ttl', 'negative_ttl', 'rtr_negative_ttl']:
+            if int(self.get('cache', option)) not in range(1, 31 * 24 * 60 * 60 + 1):
+                raise Exception('Malformed configuration: expected cache.{} to be in range 1-2678400 seconds'.format(option))
+
+    def validate_delivery(self):
+        if int(self.get('delivery', 'batch_linger_ms')) not in range(0, 60001):
+            raise Exception('Malformed configuration: expected delivery.batch_linger_ms to be in range 0-60000')
+        if int(self.get('delivery', 'queue_size')) not in range(1, 1000001):
+            raise Exception('Malformed configuration: expected delivery.queue_size to be in range 1-1000000')
+        for option in ['threads'] + [backend.lower() for backend in self.ALL_BACKENDS]:
+            value = self.get('delivery', option, fallback='')
+            if not value:
+                continue
+            if int(value) not in range(1, 129):
+                raise Exception('Malformed configuration: expected delivery.{} to be in range 1-128'.format(option))
+
     def validate_events(self):
         if not self.detections_exclude_clouds.issubset(self.SENSOR_RECOGNIZED_CLOUDS):
             raise Exception(
@@ -177,6 +248,9 @@ class FigConfig(configparser.ConfigParser):
         if self.get('events', 'start_from_newest') not in ['false', 'true']:
             raise Exception('Malformed Configuration: expected events.start_from_newest must be either true or false')
 
+        if int(self.get('events', 'checkpoint_interval')) not in range(1, 3601):
+            raise Exception('Malformed configuration: expected events.checkpoint_interval to be in range 1-3600')
+
         # Validate mutual exclusivity between start_from_newest and offset
         if self.getboolean('events', 'start_from_newest') and int(self.get('events', 'offset')) != 0:
             raise Exception('Malformed Configuration: events.start_from_newest and events.offset are mutually exclusive. '
@@ -194,6 +268,10 @@ class FigConfig(configparser.ConfigParser):
                 raise Exception('Malformed Configuration: expected aws.confirm_instance must be either true or false')
             if self.get('aws', 'accept_all_events') not in ['false', 'true']:
                 raise Exception('Malformed Configuration: expected aws.accept_all_events must be either true or false')
+            if int(self.get('aws', 'finding_index_size')) not in range(1, 10000001):
+                raise Exception('Malformed configuration: expected aws.finding_index_size to be in range 1-10000000')
+            if int(self.get('aws', 'finding_index_ttl')) not in range(1, 90 * 24 * 60 * 60 + 1):
+                raise Exception('Malformed configuration: expected aws.finding_index_ttl to be in range 1-7776000 seconds')
         if 'AWS_SQS' in self.backends:
             if len(self.get('aws_sqs', 'region')) == 0:
                 raise Exception('Malformed Configuration: expected aws_sqs.region to be non-empty')
@@ -241,6 +319,17 @@ class FigConfig(configparser.ConfigParser):
     def backends(self):
         return set(self.get('main', 'backends').split(','))
 
+    def queue_max_size(self):
+        # Unlimited by default when events are spooled to disk, the spool is bounded by the disk space
+        value = self.get('main', 'queue_max_size')
+        if value:
+            return int(value)
+        return 0 if self.get('main', 'spool_directory') else 1000
+
+    def delivery_threads(self, backend):
+        return int(self.get('delivery', backend.lower(), fallback='') or self.get('delivery', 'threads')
+                   or self.get('main', 'worker_threads'))
+
     @cached_property
     def detections_exclude_clouds(self):
         value = self.get('events', 'detections_exclude_clouds')
@@ -1,5 +1,5 @@
 from .api import FalconAPI
-from .models import Event
+from .models import Event, RawEvent
 from .stream import StreamManagementThread
 
-__all__ = ['Event', 'FalconAPI', 'StreamManagementThread']
+__all__ = ['Event', 'FalconAPI', 'RawEvent', 'StreamManagementThread']
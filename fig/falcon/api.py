@@ -1,12 +1,34 @@
+import random
+import threading
+import time
+import requests
 from falconpy import api_complete as FalconSDK
 from ..config import config
-from .errors import ApiError, NoStreamsError
+from ..log import log
+from .errors import ApiError, NoStreamsError, RTRError
 from .models import Stream
-from .rtr import RTRSession
+from .ratelimit import RateLimiter
+from .rtr import RTRBatchSession, RTRCommandPoller
 from .. import __version__
 
 
-class FalconAPI():
+class FalconAPI():  # pylint: disable=too-many-instance-attributes
+    """Client of the CrowdStrike Falcon API.
+
+    The process is meant to use a single instance (see FalconAPI.shared()), so all the threads share one pool of
+    keep-alive HTTPS connections and one OAuth2 token for all the calls but RTR session deletion, which uses a
+    token of its own. The token is renewed TOKEN_RENEW_WINDOW seconds before it expires, by one thread at a time.
+    Requests are paced by a RateLimiter shared by all the threads and requests throttled by Falcon (HTTP 429) are
+    retried.
+    """
+    TOKEN_RENEW_WINDOW = 300
+    # Calls keeping the event stream alive are served before any enrichment call
+    PRIORITY_ACTIONS = frozenset(['refreshActiveStreamSession', 'listAvailableStreamsOAuth2'])
+    RETRY_BASE_DELAY = 1
+    RETRY_MAX_DELAY = 60
+    _shared = None
+    _shared_lock = threading.Lock()
+
     CLOUD_REGIONS = {
         'us-1': 'api.crowdstrike.com',
         'us-2': 'api.us-2.crowdstrike.com',
@@ -18,12 +40,35 @@ class FalconAPI():
         backends = config.get('main', 'backends')
         # Convert comma-separated backends to space-separated products (RFC 7231 compliant)
         backend_products = ' '.join(f"{backend.strip()}-Backend" for backend in backends.split(',') if backend.strip())
+        self.user_agent = f"falcon-integration-gateway/{__version__} {backend_products}".strip()
+
+        # Delivery threads of all the backends (which run the enrichments), RTR polling and the scheduler
+        # (stream refresh) may all talk to the API at the same time
+        pool_size = sum(config.delivery_threads(backend) for backend in config.backends if backend) + 4
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
 
         self.client = FalconSDK.APIHarness(creds={
             'client_id': config.get('falcon', 'client_id'),
             'client_secret': config.get('falcon', 'client_secret')},
-            user_agent=f"falcon-integration-gateway/{__version__} {backend_products}".strip(),
-            base_url=self.__class__.base_url())
+            user_agent=self.user_agent,
+            base_url=self.__class__.base_url(),
+            renew_window=self.TOKEN_RENEW_WINDOW,
+            session=self.session)
+        self._auth_lock = threading.Lock()
+        self._rtr_client = None
+        self.rate_limiter = RateLimiter(int(config.get('falcon', 'api_rate_limit')))
+        self.max_retries = int(config.get('falcon', 'api_max_retries'))
+        self.rtr_command_timeout = int(config.get('falcon', 'rtr_command_timeout'))
+        self.rtr_poller = RTRCommandPoller(self.rtr_command_timeout)
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide instance, creating it on first use"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
 
     @classmethod
     def base_url(cls):
@@ -44,45 +89,141 @@ class FalconAPI():
                           'appId': app_id
                       })
 
-    def device_details(self, device_id):
-        return self._resources(action='GetDeviceDetailsV2', ids=[device_id])
+    def device_details(self, device_ids):
+        # Devices not known to Falcon are reported as errors next to the devices found, so a single unknown id
+        # does not fail the lookup of the whole batch
+        response = self._request(action='GetDeviceDetailsV2', ids=list(device_ids))
+        body = response['body']
+        if response.get('status_code') not in (200, 404):
+            trace_id = body.get('meta', {}).get('trace_id', '')
+            raise ApiError('Unexpected response code from Falcon API. Response was: {} (trace_id: {})'.format(response, trace_id))
+        if body.get('errors'):
+            log.debug('Some devices could not be looked up: %s', body['errors'])
+        return body.get('resources') or []
 
-    def init_rtr_session(self, device_id):
-        return self._resources(
-            action='RTR_InitSession',
+    def batch_init_rtr_sessions(self, device_ids, timeout):
+        return self._command(
+            action='BatchInitSessions',
+            parameters={
+                'timeout': timeout
+            },
             body={
-                'device_id': device_id
+                'host_ids': list(device_ids),
+                'queue_offline': False
             }
-        )
+        )['body']
 
-    def execute_rtr_command(self, action, session_id, base_command, command_string):
-        return self._resources(
+    def batch_execute_rtr_command(self, action, batch_id, device_ids, base_command, command_string, timeout):
+        return self._combined_resources(
             action=action,
+            parameters={
+                'timeout': timeout
+            },
             body={
                 'base_command': base_command,
+                'batch_id': batch_id,
                 'command_string': command_string,
-                'session_id': session_id
+                'optional_hosts': list(device_ids)
             }
         )
 
-    def check_rtr_command_status(self, cloud_request_id, sequence_id):
+    def batch_get_rtr_file(self, batch_id, device_ids, filepath, timeout):
+        return self._command(
+            action='BatchGetCmd',
+            parameters={
+                'timeout': timeout
+            },
+            body={
+                'batch_id': batch_id,
+                'file_path': filepath,
+                'optional_hosts': list(device_ids)
+            }
+        )['body']
+
+    def batch_get_rtr_file_status(self, batch_get_cmd_req_id, timeout):
         return self._resources(
-            action='RTR_CheckCommandStatus',
+            action='BatchGetCmdStatus',
             parameters={
-                'cloud_request_id': cloud_request_id,
-                'sequence_id': sequence_id,
+                'batch_get_cmd_req_id': batch_get_cmd_req_id,
+                'timeout': timeout
+            }
+        ) or {}
+
+    def delete_rtr_sessions(self, session_ids):
+        # return self.client.command('RTR_DeleteSession', session_id=session_id)
+        # Below is a workaround for the above not working properly (/cc @jshcodes)
+        rtr_client = self._real_time_response()
+        for session_id in session_ids:
+            response = rtr_client.delete_session(session_id=session_id)
+            if response['status_code'] != 204:
+                log.debug('Unable to close the RTR session: reponse was: %s', response)
+
+    def _real_time_response(self):
+        with self._auth_lock:
+            if self._rtr_client is None:
+                from falconpy import OAuth2, RealTimeResponse  # pylint: disable=C0415
+                falcon_auth = OAuth2(
+                    client_id=config.get('falcon', 'client_id'),
+                    client_secret=config.get('falcon', 'client_secret'),
+                    base_url=self.__class__.base_url(),
+                    user_agent=self.user_agent,
+                    renew_window=self.TOKEN_RENEW_WINDOW,
+                    session=self.session
+                )
+                self._rtr_client = RealTimeResponse(auth_object=falcon_auth)
+            return self._rtr_client
+
+    def rtr_extracted_file_contents(self, session_id, sha256, filepath):
+        response = self._request(
+            'RTR_GetExtractedFileContents',
+            parameters={
+                'session_id': session_id,
+                'sha256': sha256,
+                'filepath': filepath,
             }
         )
+        if not isinstance(response, (bytes, bytearray)):
+            raise RTRError(f"Could not fetch RTR file from Falcon: {response['body']}")
+        return response
+
+    def rtr_fetch_files(self, device_ids, filepath):
+        """Fetch the same file from many devices using a single batch RTR session.
+
+        Returns dictionary device_id -> file content, or an exception instance for devices the file could not be
+        fetched from.
+        """
+        session = RTRBatchSession(self, device_ids, self.rtr_command_timeout)
+        try:
+            z7packs = session.get_file(filepath)
+        finally:
+            session.close()
 
-    def rtr_fetch_file(self, device_id, filepath):
-        session = RTRSession(self, device_id)
+        results = {}
+        for device_id in device_ids:
+            z7pack = z7packs.get(device_id, RTRError(f'RTR File Not Found: device: {device_id}, file: {filepath}'))
+            if isinstance(z7pack, Exception):
+                results[device_id] = z7pack
+                continue
+            try:
+                results[device_id] = self._extract_rtr_file(z7pack, device_id, filepath)
+            except Exception as e:  # pylint: disable=broad-except
+                results[device_id] = e
+        return results
 
-        z7pack = None
+    def rtr_execute_many(self, device_ids, action, base_command, command_string):
+        """Run command on many devices using a single batch RTR session.
+
+        Returns dictionary device_id -> command response, or an exception instance for devices the command
+        failed on.
+        """
+        session = RTRBatchSession(self, device_ids, self.rtr_command_timeout)
         try:
-            z7pack = session.get_file(filepath)
+            return session.execute(action, base_command, command_string)
         finally:
             session.close()
 
+    @staticmethod
+    def _extract_rtr_file(z7pack, device_id, filepath):
         import io  # pylint: disable=C0415
         import py7zr  # pylint: disable=C0415
 
@@ -103,8 +244,46 @@ class FalconAPI():
             return []
         return body['resources']
 
+    def _combined_resources(self, *args, **kwargs):
+        # Batch RTR commands return results of each host under combined.resources
+        response = self._command(*args, **kwargs)
+        return (response['body'].get('combined') or {}).get('resources') or {}
+
+    def _authenticate(self):
+        # APIHarness renews expired token on its own, but without any locking all the threads that notice the
+        # expiration at once would request a new token
+        if not self.client.token_expired():
+            return
+        with self._auth_lock:
+            if self.client.token_expired():
+                self.client.authenticate()
+
+    def _request(self, *args, **kwargs):
+        action = kwargs.get('action') or args[0]
+        priority = RateLimiter.HIGH if action in self.PRIORITY_ACTIONS else RateLimiter.NORMAL
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(priority)
+            self._authenticate()
+            response = self.client.command(*args, **kwargs)
+            if not isinstance(response, dict):
+                # Binary content of a file
+                return response
+            self.rate_limiter.update(response.get('headers'))
+            if response.get('status_code') != 429 or attempt >= self.max_retries:
+                return response
+
+            backoff = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** attempt)
+            self.rate_limiter.throttle(response.get('headers'), backoff)
+            attempt += 1
+            # Jitter spreads the retries of the threads throttled at the same time
+            delay = random.uniform(0, backoff)  # nosec B311
+            log.warning("Falcon API rate limit exceeded (%s), retrying in %.1f seconds (attempt %d/%d)",
+                        action, delay, attempt, self.max_retries)
+            time.sleep(delay)
+
     def _command(self, *args, **kwargs):
-        response = self.client.command(*args, **kwargs)
+        response = self._request(*args, **kwargs)
         body = response['body']
         trace_id = body.get('meta', {}).get('trace_id', '')
         if 'errors' in body and body['errors'] is not None:
@@ -0,0 +1,60 @@
+import logging
+import time
+import datetime
+from .models import RawEvent
+from ..config import config
+from ..log import log
+
+
+class EventFilter():
+    """Relevance filter applied to every event read from the stream.
+
+    Configuration is resolved once when the filter is created, so evaluating an event boils down to a few set
+    lookups and integer comparisons on the RawEvent metadata. The age cut-off is recomputed by refresh(), which
+    the owner of the filter is expected to call every CUTOFF_REFRESH_INTERVAL seconds.
+    """
+    CUTOFF_REFRESH_INTERVAL = 60
+
+    def __init__(self, relevant_event_types, severity_threshold, older_than_days):
+        self.relevant_event_types = None if relevant_event_types is None else frozenset(relevant_event_types)
+        self.severity_threshold = severity_threshold
+        # Events with unknown severity name are treated as Critical, hence only the names below the threshold
+        # are listed explicitly
+        self.skipped_severities = frozenset(name for name, value in RawEvent.SEVERITY_VALUES.items()
+                                            if value < severity_threshold)
+        self.max_age_ms = older_than_days * 24 * 60 * 60 * 1000
+        self.cutoff_ms = 0
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, relevant_event_types):
+        return cls(relevant_event_types,
+                   int(config.get('events', 'severity_threshold')),
+                   int(config.get('events', 'older_than_days_threshold')))
+
+    def refresh(self):
+        self.cutoff_ms = int(time.time() * 1000) - self.max_age_ms
+
+    def irrelevant(self, event: RawEvent):
+        if self.relevant_event_types is not None and event.event_type not in self.relevant_event_types:
+            return True
+
+        severity_name = event.severity_name
+        if severity_name in self.skipped_severities:
+            if log.level <= logging.DEBUG:
+                log.debug("Event skipped: severity %d below threshold %d (offset: %s)",
+                          RawEvent.SEVERITY_VALUES[severity_name], self.severity_threshold, event.offset)
+            return True
+
+        if int(event.metadata['eventCreationTime']) < self.cutoff_ms:
+            if log.level <= logging.DEBUG:
+                log.debug("Event skipped: creation time %s before cut-off date %s (offset: %s)",
+                          event.creation_time.strftime('%Y-%m-%d %H:%M:%S'),
+                          self.format_ms(self.cutoff_ms), event.offset)
+            return True
+
+        return False
+
+    @staticmethod
+    def format_ms(timestamp_ms):
+        return datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0).strftime('%Y-%m-%d %H:%M:%S')
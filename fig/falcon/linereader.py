@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class LineReader():
+    """Split the body of the streaming connection into lines.
+
+    Chunks are appended to a single reusable buffer and lines are cut out of it through a memoryview, so each
+    event is copied exactly once, no matter how many chunks it spans. Trailing carriage returns are stripped.
+    Blank lines are keep-alive heartbeats sent by Falcon; they are yielded as empty bytes so the consumer can
+    tell the connection is alive.
+    """
+    EMPTY = b''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bytes_read = 0
+        self.lines = 0
+        self.heartbeats = 0
+        self._lock = threading.Lock()
+        self._sampled_at = time.monotonic()
+        self._sampled_bytes = 0
+
+    def __iter__(self):
+        buffer = bytearray()
+        for chunk in self.chunks:
+            self.bytes_read += len(chunk)
+            buffer += chunk
+            start = 0
+            end = buffer.find(b'\n')
+            if end < 0:
+                continue
+
+            view = memoryview(buffer)
+            try:
+                while end >= 0:
+                    line_end = end - 1 if end > start and buffer[end - 1] == 13 else end
+                    if line_end == start:
+                        self.heartbeats += 1
+                        yield self.EMPTY
+                    else:
+                        self.lines += 1
+                        yield bytes(view[start:line_end])
+                    start = end + 1
+                    end = buffer.find(b'\n', start)
+            finally:
+                # Buffer cannot be resized while the view exists
+                view.release()
+            del buffer[:start]
+
+        if buffer:
+            self.lines += 1
+            yield bytes(buffer)
+
+    def stats(self):
+        """Return counters; bytes_per_second is the average since the previous call"""
+        with self._lock:
+            now = time.monotonic()
+            bytes_read = self.bytes_read
+            rate = (bytes_read - self._sampled_bytes) / max(now - self._sampled_at, 0.001)
+            self._sampled_at = now
+            self._sampled_bytes = bytes_read
+        return {
+            'bytes': bytes_read,
+            'events': self.lines,
+            'heartbeats': self.heartbeats,
+            'bytes_per_second': int(rate),
+        }
@@ -1,13 +1,86 @@
-import json
 import re
 import datetime
-from ..config import config
-from ..log import log
+from functools import cached_property
+from ..util import jsoncodec
+
+
+class RawEvent():
+    """Event line as received from the stream, before the JSON payload is parsed.
+
+    Only the flat metadata object and the severity name are extracted from the raw bytes, which is enough to
+    decide whether the event is relevant. Full JSON parsing is deferred to parse(), so the cost is only paid for
+    events that are going to be processed by backends.
+    """
+    # Falcon sends the metadata object first; any other layout falls back to full parsing
+    METADATA_RE = re.compile(rb'\s*\{\s*"metadata"\s*:\s*(\{[^{}]*\})')
+    EVENT_RE = re.compile(rb'\s*,\s*"event"\s*:\s*\{')
+    SEVERITY_NAME_RE = re.compile(rb'"SeverityName"\s*:\s*"([^"\\]*)"')
+    NESTING_RE = re.compile(rb'[{\[]')
+    SEVERITY_VALUES = {
+        "Informational": 1,
+        "Low": 2,
+        "Medium": 3,
+        "High": 4,
+        "Critical": 5
+    }
+
+    def __init__(self, event_string, feed_id):
+        self.raw = event_string
+        self.feed_id = feed_id
+        self._event = None
+
+        match = self.METADATA_RE.match(event_string)
+        if match:
+            self.metadata = jsoncodec.loads(match.group(1))
+            self._event_start = match.end()
+        else:
+            # Unexpected layout of the event, fall back to parsing the whole event right away
+            self._event = self.parse()
+            self.metadata = self._event['metadata']
+
+    def __repr__(self):
+        return '{}(feed_id={}, offset={}, event_type={})'.format(
+            self.__class__.__name__, self.feed_id, self.offset, self.event_type)
+
+    def parse(self):
+        if self._event is not None:
+            return self._event
+        return Event(self.raw, self.feed_id)
+
+    @cached_property
+    def severity_name(self):
+        """SeverityName of the event object, Critical when missing.
+
+        Objects nested in the event may carry a SeverityName of their own. The raw bytes are only trusted when
+        the key precedes every nested object of the event, otherwise the event is parsed.
+        """
+        if self._event is None and b'"SeverityName"' not in self.raw:
+            return 'Critical'
+        if self._event is None:
+            event = self.EVENT_RE.match(self.raw, self._event_start)
+            match = self.SEVERITY_NAME_RE.search(self.raw, event.end()) if event else None
+            if match and not self.NESTING_RE.search(self.raw, event.end(), match.start()):
+                return match.group(1).decode('utf-8')
+            self._event = self.parse()
+        return self._event['event'].get('SeverityName') or 'Critical'
+
+    @property
+    def event_type(self):
+        return self.metadata['eventType']
+
+    @property
+    def offset(self):
+        return self.metadata['offset']
+
+    @cached_property
+    def creation_time(self):
+        return Event.parse_cs_time(self.metadata['eventCreationTime'])
 
 
 class Event(dict):
     def __init__(self, event_string, feed_id):
-        event = json.loads(event_string.decode('utf-8'))
+        event = jsoncodec.loads(event_string)
+        self.raw = event_string
         self.feed_id = feed_id
         super().__init__(event)
 
@@ -16,41 +89,6 @@ class Event(dict):
             return False
         return super().__eq__(self, other) and self.feed_id == other.feed_id
 
-    def irrelevant(self):
-        severity = self.mapped_severity()
-        threshold = int(config.get('events', 'severity_threshold'))
-        cutoff = self.cut_off_date()
-
-        # Check severity threshold
-        if severity < threshold:
-            log.debug("Event skipped: severity %d below threshold %d (offset: %s)",
-                      severity, threshold, self.offset)
-            return True
-
-        # Check cut-off date
-        if self.creation_time < cutoff:
-            # Format datetime objects directly
-            event_date = self.creation_time.strftime('%Y-%m-%d %H:%M:%S')
-            cutoff_date = cutoff.strftime('%Y-%m-%d %H:%M:%S')
-
-            log.debug("Event skipped: creation time %s before cut-off date %s (offset: %s)",
-                      event_date, cutoff_date, self.offset)
-            return True
-
-        return False
-
-    def mapped_severity(self):
-        """Map CrowdStrike severity to internal 1-5 scale"""
-        severity_name = self['event'].get('SeverityName', 'Critical')
-        name_to_value = {
-            "Informational": 1,
-            "Low": 2,
-            "Medium": 3,
-            "High": 4,
-            "Critical": 5
-        }
-        return name_to_value.get(severity_name, 5)  # Default to 5 (highest) if unknown
-
     @property
     def event_type(self):
         return self['metadata']['eventType']
@@ -67,7 +105,7 @@ class Event(dict):
     def severity(self):
         return self['event'].get('Severity', 5)
 
-    @property
+    @cached_property
     def creation_time(self):
         return self.parse_cs_time(self['metadata']['eventCreationTime'])
 
@@ -84,10 +122,6 @@ class Event(dict):
     def parse_cs_time(cls, cs_timestamp):
         return datetime.datetime.utcfromtimestamp(float(cs_timestamp) / 1000.0)
 
-    @classmethod
-    def cut_off_date(cls):
-        return datetime.datetime.now() - datetime.timedelta(days=int(config.get('events', 'older_than_days_threshold')))
-
 
 class Stream(dict):
     @property
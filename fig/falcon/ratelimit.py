@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+class RateLimiter():  # pylint: disable=too-many-instance-attributes
+    """Token bucket pacing the requests of all threads calling the Falcon API.
+
+    The bucket is refilled at `requests_per_minute` / 60 tokens per second and holds at most 10 seconds worth of
+    tokens. Rate limit headers returned by Falcon (X-RateLimit-Remaining) shrink the bucket when the server-side
+    budget is lower than the local one, and a throttled response (HTTP 429) pauses all callers until the time
+    announced by Falcon.
+
+    Callers of higher priority (lower number) are served first: a caller only takes a token when no caller of
+    higher priority is waiting.
+    """
+    HIGH = 0
+    NORMAL = 1
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * 10)
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0
+        self._waiting = [0, 0]
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.delayed = 0
+
+    def acquire(self, priority=NORMAL):
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                delayed = False
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._paused_until - now
+                    if wait <= 0:
+                        if self._outranked(priority):
+                            wait = None
+                        elif self._tokens >= 1:
+                            self._tokens -= 1
+                            self.delayed += delayed
+                            return
+                        else:
+                            wait = (1 - self._tokens) / self.rate
+                    delayed = True
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def update(self, headers):
+        """Align the bucket with the remaining budget reported by Falcon"""
+        remaining = self._header(headers, 'X-RateLimit-Remaining')
+        if remaining is None:
+            return
+        with self._cond:
+            self._tokens = min(self._tokens, remaining)
+
+    def throttle(self, headers, default_delay):
+        """Record a throttled response and pause all callers. Returns the number of seconds paused."""
+        now = time.time()
+        delay = default_delay
+        retry_after = self._header(headers, 'X-RateLimit-RetryAfter')
+        if retry_after is None:
+            retry_after = self._header(headers, 'Retry-After')
+        if retry_after is not None:
+            # Falcon announces the time the limit resets as epoch seconds, standard Retry-After is relative
+            delay = retry_after - now if retry_after > 1000000000 else retry_after
+            delay = max(delay, 0)
+        with self._cond:
+            self.throttled += 1
+            self._tokens = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def stats(self):
+        with self._cond:
+            return {
+                'tokens': int(self._tokens),
+                'throttled': self.throttled,
+                'delayed': self.delayed,
+            }
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _outranked(self, priority):
+        return any(self._waiting[p] for p in range(priority))
+
+    @staticmethod
+    def _header(headers, name):
+        if not headers:
+            return None
+        name = name.lower()
+        for key, value in headers.items():
+            if key.lower() == name:
+                try:
+                    return float(value)
+                except (TypeError, ValueError):
+                    return None
+        return None
@@ -1,87 +1,164 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
 from .errors import ApiError, RTRError, RTRConnectionError
-from ..log import log
 
 
-class RTRSession:
-    def __init__(self, falcon_api, device_id):
+class RTRCommandPoller():
+    """Poll the status of pending RTR commands from a single thread.
+
+    `check(expired)` is called with exponentially growing delay until it returns anything but None, or until the
+    deadline passes; the last call is made with expired=True. Callers get a Future resolved with the returned
+    value, or failed with RTRError when the command did not complete in time.
+    """
+    INITIAL_DELAY = 0.5
+    MAX_DELAY = 10
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._pending = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, check, timeout=None):
+        future = Future()
+        now = time.monotonic()
+        timeout = self.timeout if timeout is None else timeout
+        command = (check, future, now + timeout, timeout)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rtr_poller', daemon=True)
+                self._thread.start()
+            self._schedule(min(now + self.INITIAL_DELAY, now + timeout), self.INITIAL_DELAY, command)
+        return future
+
+    def _schedule(self, when, delay, command):
+        heapq.heappush(self._pending, (when, next(self._sequence), delay, command))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending or self._pending[0][0] > time.monotonic():
+                    self._cond.wait(self._pending[0][0] - time.monotonic() if self._pending else None)
+                _when, _seq, delay, command = heapq.heappop(self._pending)
+            self._poll(delay, command)
+
+    def _poll(self, delay, command):
+        check, future, deadline, timeout = command
+        now = time.monotonic()
+        expired = now >= deadline
+        try:
+            result = check(expired)
+        except Exception as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+            return
+
+        if result is not None:
+            future.set_result(result)
+            return
+        if expired:
+            future.set_exception(RTRError(f'RTR command did not complete within {timeout} seconds'))
+            return
+        delay = min(delay * 2, self.MAX_DELAY)
+        with self._cond:
+            self._schedule(min(now + delay, deadline), delay, command)
+
+
+class RTRBatchSession:
+    """RTR session opened on many hosts at once.
+
+    Commands are sent to all connected hosts with a single API call. Results are returned as a dictionary
+    device_id -> result, where the result is an exception instance for hosts the command failed on (including
+    hosts the session could not be opened on).
+    """
+    # Batch RTR endpoints accept timeouts of at most 10 minutes
+    MAX_TIMEOUT = 600
+
+    def __init__(self, falcon_api, device_ids, timeout):
         self.falcon = falcon_api
-        self.device_id = device_id
-        self.session = self._connect()
+        self.timeout = min(timeout, self.MAX_TIMEOUT)
+        self.sessions = {}
+        self.errors = {}
+        self.batch_id = self._connect(device_ids)
 
     def close(self):
-        # return self.falcon.client.command('RTR_DeleteSession', session_id=self.id)
-        # Below is a workaround for the above not working properly (/cc @jshcodes)
-
-        from falconpy import OAuth2, RealTimeResponse  # pylint: disable=C0415
-        from ..config import config  # pylint: disable=C0415
-        falcon_auth = OAuth2(
-            client_id=config.get('falcon', 'client_id'),
-            client_secret=config.get('falcon', 'client_secret')
-        )
-        falcon_rtr = RealTimeResponse(falcon_auth)
-        response = falcon_rtr.delete_session(session_id=self.id)
-        if response['status_code'] != 204:
-            log.debug('Unable to close the RTR session: reponse was: %s', response)
-
-    def execute_and_wait(self, action, base_command, command_string):
-        command = self._execute(action, base_command, command_string)
-        response = self._rtr_wait(command[0])
-
-        if response['stderr']:
-            raise RTRError(f'RTR Execute device: {self.device_id}, stderr: {response["stderr"]}, (session_id: {response["session_id"]}, task_id: {response["task_id"]})')
-        return response
+        self.falcon.delete_rtr_sessions(self.sessions.values())
+
+    def execute(self, action, base_command, command_string):
+        """Run command on all connected hosts. Returns device_id -> command response (or exception)"""
+        results = dict(self.errors)
+        if not self.sessions:
+            return results
+
+        resources = self.falcon.batch_execute_rtr_command(
+            action, self.batch_id, list(self.sessions), base_command, command_string, self.timeout)
+        for device_id in self.sessions:
+            response = resources.get(device_id)
+            if response is None or not response.get('complete'):
+                results[device_id] = RTRError(f'RTR command did not complete on device: {device_id} (batch_id: {self.batch_id})')
+            elif response.get('errors'):
+                results[device_id] = RTRError(f'RTR Execute device: {device_id}, errors: {response["errors"]} (batch_id: {self.batch_id})')
+            else:
+                results[device_id] = response
+        return results
 
     def get_file(self, filepath):
-        command = self.execute_and_wait('RTR_ExecuteActiveResponderCommand', 'get', 'get ' + filepath)
-        files = self._list_files()
-        for f in files:
-            if f['cloud_request_id'] == command['task_id']:
-                return self._fetch_file(f['sha256'], filepath)
-
-        log.error('RTR File Not Found. Searching for cloud_request_id=%s, but found only %s', command["task_id"], files)
-        raise RTRError(f'RTR File Not Found: device: {self.device_id}, file: {filepath} (session_id: {command["session_id"]}, task_id: {command["session_id"]})')
-
-    @property
-    def id(self):
-        return self.session['session_id']
-
-    def _list_files(self):
-        return self.falcon._resources(  # pylint: disable=W0212
-            'RTR_ListFiles',
-            parameters={
-                'session_id': self.id
-            }
-        )
-
-    def _fetch_file(self, sha256, filepath):
-        response = self.falcon.client.command(
-            'RTR_GetExtractedFileContents',
-            parameters={
-                'session_id': self.id,
-                'sha256': sha256,
-                'filepath': filepath,
-            }
-        )
-        if not isinstance(response, (bytes, bytearray)):
-            raise RTRError(f"Could not fetch RTR file from Falcon: {response['body']}")
-        return response
-
-    def _connect(self):
-        response = None
+        """Upload file from all connected hosts to Falcon. Returns device_id -> file content (or exception)"""
+        results = dict(self.errors)
+        if not self.sessions:
+            return results
+
+        body = self.falcon.batch_get_rtr_file(self.batch_id, list(self.sessions), filepath, self.timeout)
+        for device_id, response in ((body.get('combined') or {}).get('resources') or {}).items():
+            if device_id in self.sessions and response.get('stderr'):
+                results[device_id] = RTRError(f'RTR Execute device: {device_id}, stderr: {response["stderr"]} (batch_id: {self.batch_id})')
+
+        pending = {device_id for device_id in self.sessions if device_id not in results}
+        uploaded = self.falcon.rtr_poller.submit(
+            partial(self._uploaded_files, body['batch_get_cmd_req_id'], pending), self.timeout).result()
+        for device_id in pending:
+            if device_id not in uploaded:
+                results[device_id] = RTRError(f'RTR File Not Found: device: {device_id}, file: {filepath} (batch_id: {self.batch_id})')
+                continue
+            try:
+                results[device_id] = self.falcon.rtr_extracted_file_contents(
+                    self.sessions[device_id], uploaded[device_id]['sha256'], filepath)
+            except RTRError as e:
+                results[device_id] = e
+        return results
+
+    def _uploaded_files(self, batch_get_cmd_req_id, device_ids, expired):
+        # Files appear in the status response once they have been uploaded from the host. Once the deadline
+        # passes, whatever was uploaded so far is returned.
+        resources = self.falcon.batch_get_rtr_file_status(batch_get_cmd_req_id, self.timeout)
+        uploaded = {}
+        for device_id in device_ids:
+            files = resources.get(device_id)
+            if isinstance(files, list):
+                files = files[0] if files else None
+            if files and files.get('sha256'):
+                uploaded[device_id] = files
+        if len(uploaded) == len(device_ids) or expired:
+            return uploaded
+        return None
+
+    def _connect(self, device_ids):
         try:
-            response = self.falcon.init_rtr_session(self.device_id)
+            body = self.falcon.batch_init_rtr_sessions(device_ids, self.timeout)
         except ApiError as e:
             raise RTRConnectionError(f"{e}") from e
 
-        if len(response) != 1:
-            raise RTRError(f'Unexpected response from RTR Init: {response}')
-        return response[0]
-
-    def _rtr_wait(self, command):
-        check = self.falcon.check_rtr_command_status(command['cloud_request_id'], 0)[0]
-        while not check['complete']:
-            check = self.falcon.check_rtr_command_status(command['cloud_request_id'], 0)[0]
-        return check
-
-    def _execute(self, action, base_command, command_string):
-        return self.falcon.execute_rtr_command(action, self.id, base_command, command_string)
+        resources = body.get('resources') or {}
+        for device_id in device_ids:
+            response = resources.get(device_id)
+            if response is None or response.get('errors') or not response.get('session_id'):
+                errors = response.get('errors') if response else 'no response'
+                self.errors[device_id] = RTRConnectionError(f'Cannot open RTR session on device: {device_id}, errors: {errors}')
+            else:
+                self.sessions[device_id] = response['session_id']
+        return body.get('batch_id')
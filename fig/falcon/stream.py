@@ -1,45 +1,119 @@
-import sys
 import datetime
 import logging
+import random
 import time
 import threading
+from queue import Full
 import requests
 
 from .api import FalconAPI, NoStreamsError
-from .models import Event, Stream
+from .filters import EventFilter
+from .linereader import LineReader
+from .models import RawEvent, Stream
 from ..util import StoppableThread
+from ..util.scheduler import scheduler
 from ..log import log
 from ..config import config
 
 
-class StreamManagementThread(threading.Thread):
-    """Thread that spins-out sub-threads to manage CrowdStrike Falcon Streaming API"""
+class StreamManagementThread(threading.Thread):  # pylint: disable=too-many-instance-attributes
+    """Thread that spins-out sub-threads to manage CrowdStrike Falcon Streaming API
+
+    The streaming threads are watched and the stream session is restarted as soon as a streaming thread dies or
+    receives no data (not even a heartbeat) for falcon.stream_stall_timeout seconds. Failed restarts are retried
+    with exponential backoff; the stream resumes from the last offset seen.
+    """
+    WATCHDOG_INTERVAL = 5
+    RECONNECT_BASE_DELAY = 1
+    RECONNECT_MAX_DELAY = 60
 
     def __init__(self, output_queue, relevant_event_types, *args, **kwargs):
         kwargs['name'] = kwargs.get('name', 'cs_mngmt')
         super().__init__(*args, **kwargs)
         self.output_queue = output_queue
-        self.relevant_event_types = relevant_event_types
+        self.event_filter = EventFilter.from_config(relevant_event_types)
+        scheduler.call_every(EventFilter.CUTOFF_REFRESH_INTERVAL, self.event_filter.refresh)
         self.application_id = config.get('falcon', 'application_id')
+        self.stall_timeout = int(config.get('falcon', 'stream_stall_timeout'))
+        self.reconnects = 0
+        self.stalls = 0
+        self.failures = 0
+        self.streaming_threads = []
 
     def run(self):
         while True:
+            started = time.monotonic()
             try:
-                workers_died_event = self.start_workers()
-                while not workers_died_event.is_set():
-                    time.sleep(60)
-                log.debug("Restarting stream session")
+                self.supervise(*self.start_workers())
+                # Session that ran for a while resets the backoff, so the next reconnect is immediate
+                if time.monotonic() - started >= self.RECONNECT_MAX_DELAY:
+                    self.failures = 0
+                else:
+                    self.failures += 1
             except Exception:  # pylint: disable=broad-except
                 log.exception("Could not restart stream session")
-                sys.exit(1)  # TODO implement re-try mechanism
+                self.failures += 1
+
+            self.reconnects += 1
+            delay = self.reconnect_delay()
+            log.warning("Restarting stream session in %.1f seconds. Stream stats: %s", delay, self.stats())
+            time.sleep(delay)
+
+    def reconnect_delay(self):
+        if self.failures == 0:
+            return 0
+        delay = min(self.RECONNECT_MAX_DELAY, self.RECONNECT_BASE_DELAY * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)  # nosec B311
+
+    def stats(self):
+        return {
+            'reconnects': self.reconnects,
+            'stalls': self.stalls,
+            'consecutive_failures': self.failures,
+            'feeds': {t.stream.feed_id: t.conn.reader.stats() for t in self.streaming_threads if t.conn.reader},
+        }
 
     def start_workers(self):
         stop_event = threading.Event()
-        falcon_api = FalconAPI()
+        falcon_api = FalconAPI.shared()
+        streaming_threads = []
+        refresh_tasks = []
         for stream in self.get_streams(falcon_api):
-            StreamingThread(stream, self.output_queue, self.relevant_event_types, stop_event=stop_event).start()
-            StreamRefreshThread(self.application_id, stream, falcon_api, stop_event=stop_event).start()
-        return stop_event
+            streaming_thread = StreamingThread(stream, self.output_queue, self.event_filter, stop_event=stop_event)
+            streaming_thread.start()
+            streaming_threads.append(streaming_thread)
+            refresh_tasks.append(scheduler.call_every(stream.refresh_interval * 9 / 10, self.refresh_stream_session,
+                                                      falcon_api, stream, stop_event))
+        self.streaming_threads = streaming_threads
+        return stop_event, streaming_threads, refresh_tasks
+
+    def refresh_stream_session(self, falcon_api, stream, stop_event):
+        if stop_event.is_set():
+            return
+        try:
+            falcon_api.refresh_streaming_session(self.application_id, stream)
+            log.debug("Refresh of streaming session succeeded")
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Could not refresh streaming session")
+            stop_event.set()
+
+    def supervise(self, stop_event, streaming_threads, refresh_tasks):
+        while not stop_event.wait(self.WATCHDOG_INTERVAL):
+            for streaming_thread in streaming_threads:
+                idle = streaming_thread.idle_seconds()
+                if idle >= self.stall_timeout:
+                    log.warning("No data received from stream %s for %.0f seconds", streaming_thread.stream.feed_id, idle)
+                    self.stalls += 1
+                    stop_event.set()
+                    break
+
+        for task in refresh_tasks:
+            task.cancel()
+        # Closing the connections unblocks the threads still waiting for data
+        for streaming_thread in streaming_threads:
+            streaming_thread.conn.close()
+        for streaming_thread in streaming_threads:
+            streaming_thread.join(self.WATCHDOG_INTERVAL)
 
     def get_streams(self, falcon_api):
         retry_count = int(config.get('falcon', 'reconnect_retry_count'))
@@ -54,38 +128,13 @@ class StreamManagementThread(threading.Thread):
         raise NoStreamsError(self.application_id)
 
 
-class StreamRefreshThread(StoppableThread):
-    def __init__(self, application_id, stream: Stream, falcon_api: FalconAPI, *args, **kwargs):
-        kwargs['name'] = kwargs.get('name', 'cs_refresh')
-        super().__init__(*args, **kwargs)
-        self.stream = stream
-        self.falcon_api = falcon_api
-        self.application_id = application_id
-
-    def run(self):
-        try:
-            self.sleep()
-            while not self.stopped:
-                self.refresh_stream_session()
-                self.sleep()
-
-        finally:
-            self.stop()
-
-    def sleep(self):
-        time.sleep(self.stream.refresh_interval * 9 / 10)
-
-    def refresh_stream_session(self):
-        self.falcon_api.refresh_streaming_session(self.application_id, self.stream)
-        log.debug("Refresh of streaming session succeeded")
-
-
 class StreamingThread(StoppableThread):  # pylint: disable=too-many-instance-attributes
-    def __init__(self, stream: Stream, queue, relevant_event_types, *args, **kwargs):
+    def __init__(self, stream: Stream, queue, event_filter: EventFilter, *args, **kwargs):
         kwargs['name'] = kwargs.get('name', 'cs_stream')
         super().__init__(*args, **kwargs)
 
-        # Obtain offset values from config and queue
+        # Obtain offset values from config and queue. The queue offset covers both the previous stream session
+        # of this process and the checkpoint committed by the previous run of the gateway (if enabled).
         config_offset = int(config.get('events', 'offset'))
         queue_offset = queue.last_offset(stream.feed_id)
         start_from_newest = config.getboolean('events', 'start_from_newest')
@@ -109,22 +158,34 @@ class StreamingThread(StoppableThread):  # pylint: disable=too-many-instance-att
             self.use_whence = False
 
         self.stream = stream
-        self.conn = StreamingConnection(self.stream, self.offset, relevant_event_types, self.use_whence)
+        self.conn = StreamingConnection(self.stream, self.offset, event_filter.relevant_event_types, self.use_whence)
         self.queue = queue
-        self.relevant_event_types = relevant_event_types
+        self.event_filter = event_filter
         self.event_count = 0
         self.event_count_types = {}
+        self.paused_since = None
+        self.last_activity = time.monotonic()
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_activity
 
     def run(self):
         try:
             for event in self.conn.events():
-                if event:
-                    self.process_event(event)
-
+                # Empty lines are heartbeats, they show the connection is alive
+                self.last_activity = time.monotonic()
                 if self.stopped:
                     break
+                if event:
+                    self.process_event(event)
         except requests.exceptions.ChunkedEncodingError:
             pass  # ChunkedEncodingError is expected when streaming session closes abruptly
+        except requests.exceptions.RequestException as e:
+            log.warning("Streaming Connection failed: %s", e)
+        except (AttributeError, ValueError):
+            # Reading from connection closed by the stream watchdog
+            if not self.stopped:
+                raise
         finally:
             log.warning("Streaming Connection was closed.")
             if not self.stopped:
@@ -133,12 +194,35 @@ class StreamingThread(StoppableThread):  # pylint: disable=too-many-instance-att
                 self.conn.close()
 
     def process_event(self, event):
-        event = Event(event, self.stream.feed_id)
+        # Only the metadata is parsed here; the full payload is parsed by the worker thread for relevant events
+        event = RawEvent(event, self.stream.feed_id)
         if log.level <= logging.DEBUG:
             self.log_event(event)
 
-        if (self.relevant_event_types is None or event.event_type in self.relevant_event_types) and not event.irrelevant():
-            self.queue.put(event)
+        if not self.event_filter.irrelevant(event):
+            self.enqueue(event)
+        else:
+            self.queue.skip(event)
+
+    def enqueue(self, event):
+        # While the queue is full the stream is not read at all. Unread data stays in the socket buffers and
+        # TCP flow control pushes back on the Falcon cloud until the workers catch up.
+        while not self.stopped:
+            try:
+                self.queue.put(event, timeout=1)
+                break
+            except Full:
+                # Stream is paused on purpose, it is not stalled
+                self.last_activity = time.monotonic()
+                if self.paused_since is None:
+                    self.paused_since = time.monotonic()
+                    log.warning("Event queue is full, pausing the stream until backends catch up. Queue stats: %s",
+                                self.queue.stats())
+
+        if self.paused_since is not None:
+            log.warning("Resuming the stream after it was paused for %.1f seconds. Queue stats: %s",
+                        time.monotonic() - self.paused_since, self.queue.stats())
+            self.paused_since = None
 
     def log_event(self, event):
         self.event_count += 1
@@ -148,9 +232,17 @@ class StreamingThread(StoppableThread):  # pylint: disable=too-many-instance-att
 
 
 class StreamingConnection():
+    # Falcon streams use chunked transfer encoding, so a read returns as soon as a chunk arrives and the chunk
+    # size only caps how much is read at once
+    CHUNK_SIZE = 256 * 1024
+    CONNECT_TIMEOUT = 30
+
     def __init__(self, stream: Stream, last_seen_offset, relevant_event_types=None, use_whence=False):
         self.stream = stream
         self.connection = None
+        # Falcon sends heartbeats on idle streams, so a read only times out on a dead connection
+        self.timeout = (self.CONNECT_TIMEOUT, int(config.get('falcon', 'stream_read_timeout')))
+        self.reader = None
         self.last_seen_offset = last_seen_offset
         self.relevant_event_types = relevant_event_types
         self.use_whence = use_whence
@@ -175,15 +267,17 @@ class StreamingConnection():
             url = self.stream.url + '&offset={}'.format(offset_value) + eventTypeFilter
 
         log.debug("Streaming URL: %s", url)
-        self.connection = requests.get(url, headers=headers, stream=True, timeout=60)
+        self.connection = requests.get(url, headers=headers, stream=True, timeout=self.timeout)
         log.info("Established Streaming Connection: %d %s", self.connection.status_code, self.connection.reason)
         self.connection.raise_for_status()
         return self.connection
 
     def events(self):
-        return self.open().iter_lines()
+        self.reader = LineReader(self.open().iter_content(chunk_size=self.CHUNK_SIZE))
+        return self.reader
 
     def close(self):
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        # May be called by the stream watchdog while the streaming thread closes the connection itself
+        connection, self.connection = self.connection, None
+        if connection:
+            connection.close()
@@ -1,7 +1,13 @@
 import json
-from threading import Lock
+from functools import cached_property, partial
 from .falcon import Event
+from .falcon.errors import ApiError
+from .config import config
 from .log import log
+from .util import jsoncodec
+from .util.batching import CoalescingLoader
+from .util.cache import CacheStore, TTLCache
+from .util.scheduler import scheduler
 
 
 class TranslatorError(Exception):
@@ -17,86 +23,161 @@ class FalconAPIDataError(TranslatorError):
 
 
 class FalconCache():
+    PURGE_INTERVAL = 300
+    ARC_CONFIG_PATHS = {
+        'Linux': '/var/opt/azcmagent/agentconfig.json',
+        'Windows': 'C:\\ProgramData\\AzureConnectedMachineAgent\\Config\\agentconfig.json',
+    }
+    MDM_COMMANDS = {
+        'Windows': (
+            'BatchCmd',
+            'reg query',
+            'reg query "HKEY_LOCAL_MACHINE\\SOFTWARE\\Microsoft\\Provisioning\\OMADM\\MDMDeviceID" DeviceClientId',
+            lambda stdout: stdout.split(' = ')[1].split('\n')[0]
+        ),
+        'Mac': (
+            'BatchAdminCmd',
+            'runscript',
+            "runscript -Raw=```system_profiler SPHardwareDataType | awk '/UUID/ { print $3; }'```",
+            lambda stdout: stdout.split('\n')[0]
+        ),
+    }
+
     def __init__(self, falcon_api):
         self.falcon_api = falcon_api
-        self._host_detail = {}
-        self._mdm_id = {}
-        self._arc_config = {}
-        self._arc_config_lock = {}
+        max_entries = int(config.get('cache', 'max_entries'))
+        negative_ttl = int(config.get('cache', 'negative_ttl'))
+        store = CacheStore.shared(config.get('cache', 'path')) if config.get('cache', 'path') else None
+        self._host_detail = TTLCache('host_detail', max_entries, int(config.get('cache', 'device_ttl')), negative_ttl, store)
+        rtr_ttl = int(config.get('cache', 'rtr_ttl'))
+        rtr_negative_ttl = int(config.get('cache', 'rtr_negative_ttl'))
+        self._mdm_id = TTLCache('mdm_id', max_entries, rtr_ttl, rtr_negative_ttl, store)
+        self._arc_config = TTLCache('arc_config', max_entries, rtr_ttl, rtr_negative_ttl, store)
+        self._device_loader = CoalescingLoader(
+            self._fetch_device_details,
+            window=int(config.get('falcon', 'device_details_batch_window_ms')) / 1000.0,
+            max_batch=int(config.get('falcon', 'device_details_batch_size')))
+        # RTR lookups are grouped per platform, as all hosts within a batch session receive the same command
+        rtr_window = int(config.get('falcon', 'rtr_batch_window_ms')) / 1000.0
+        rtr_batch_size = int(config.get('falcon', 'rtr_batch_size'))
+        self._mdm_loaders = {
+            platform: CoalescingLoader(partial(self._fetch_mdm_identifiers, platform), rtr_window, rtr_batch_size)
+            for platform in self.MDM_COMMANDS
+        }
+        self._arc_loaders = {
+            platform: CoalescingLoader(partial(self._fetch_azure_arc_configs, path), rtr_window, rtr_batch_size)
+            for platform, path in self.ARC_CONFIG_PATHS.items()
+        }
+        scheduler.call_every(self.PURGE_INTERVAL, self.purge_expired)
 
     def device_details(self, sensor_id):
         if not sensor_id:
             return EventDataError("Cannot process event. SensorId field is missing: ")
 
-        if sensor_id not in self._host_detail:
-            resources = self.falcon_api.device_details(sensor_id)
+        detail = self._host_detail.get_or_load(sensor_id, lambda: self._load_device_details(sensor_id))
+        if isinstance(detail, FalconAPIDataError):
+            raise detail
+        return detail
+
+    def stats(self):
+        return {cache.name: cache.stats() for cache in (self._host_detail, self._mdm_id, self._arc_config)}
+
+    def purge_expired(self):
+        purged = sum(cache.purge_expired() for cache in (self._host_detail, self._mdm_id, self._arc_config))
+        if purged:
+            log.debug("Purged %d expired cache entries", purged)
+
+    def _load_device_details(self, sensor_id):
+        try:
+            return self._device_loader.load(sensor_id)
+        except FalconAPIDataError as e:
+            # Unknown device is cached as a negative result, so it is not looked up again for every event
+            return e
+
+    def _fetch_device_details(self, sensor_ids):
+        found = {}
+        for resource in self.falcon_api.device_details(sensor_ids):
+            found.setdefault(resource.get('device_id'), []).append(resource)
+
+        results = {}
+        for sensor_id in sensor_ids:
+            resources = found.get(sensor_id, [])
             if len(resources) > 1:
-                raise FalconAPIDataError(
+                results[sensor_id] = FalconAPIDataError(
                     'Cannot process event for device: {}, multiple devices exists'.format(sensor_id))
-            if len(resources) == 0:
-                raise FalconAPIDataError('Cannot process event for device {}, device not known'.format(sensor_id))
-            detail = self.falcon_api.device_details(sensor_id)[0]
-            self._host_detail[sensor_id] = detail
-
-        return self._host_detail[sensor_id]
+            elif len(resources) == 0:
+                results[sensor_id] = FalconAPIDataError(
+                    'Cannot process event for device {}, device not known'.format(sensor_id))
+            else:
+                results[sensor_id] = resources[0]
+        return results
 
     def azure_arc_config(self, sensor_id):
         if not sensor_id:
             return EventDataError("Cannot fetch Azure Arc info. SensorId field is missing")
 
-        with self._get_lock(sensor_id):
-            if sensor_id not in self._arc_config:
-                is_linux = self.device_details(sensor_id)['platform_name'] == 'Linux'
-                path = '/var/opt/azcmagent/agentconfig.json' if is_linux else 'C:\\ProgramData\\AzureConnectedMachineAgent\\Config\\agentconfig.json'
-                log.info('Fetching Azure Arc Config %s from the system %s', path, sensor_id)
-                file_bytes = self.falcon_api.rtr_fetch_file(sensor_id, path)
-                log.info('Fetched Azure Arc Config from the system: %s', str(file_bytes))
-                self._arc_config[sensor_id] = json.loads(file_bytes)
-            return self._arc_config[sensor_id]
-
-    def _get_lock(self, sensor_id):
-        if sensor_id not in self._arc_config_lock:
-            self._arc_config_lock[sensor_id] = Lock()
-        return self._arc_config_lock[sensor_id]
+        arc_config = self._arc_config.get_or_load(sensor_id, lambda: self._load_azure_arc_config(sensor_id))
+        if isinstance(arc_config, Exception):
+            raise arc_config
+        return arc_config
+
+    def _load_azure_arc_config(self, sensor_id):
+        platform = 'Linux' if self.device_details(sensor_id)['platform_name'] == 'Linux' else 'Windows'
+        try:
+            return self._arc_loaders[platform].load(sensor_id)
+        except (ApiError, ValueError) as e:
+            # Failed lookup is cached as a negative result, so the host is not asked again for every event
+            return e
+
+    def _fetch_azure_arc_configs(self, path, sensor_ids):
+        log.info('Fetching Azure Arc Config %s from %d systems', path, len(sensor_ids))
+        results = {}
+        for sensor_id, file_bytes in self.falcon_api.rtr_fetch_files(sensor_ids, path).items():
+            if isinstance(file_bytes, Exception):
+                results[sensor_id] = file_bytes
+                continue
+            log.info('Fetched Azure Arc Config from the system %s: %s', sensor_id, str(file_bytes))
+            try:
+                results[sensor_id] = json.loads(file_bytes)
+            except ValueError as e:
+                results[sensor_id] = e
+        return results
 
     def mdm_identifier(self, sensor_id, event_platform):
         if not sensor_id:
             return EventDataError("Cannot process event. SensorId field is missing: ")
 
-        if sensor_id not in self._mdm_id or self._mdm_id[sensor_id] is None:
-            session = self.falcon_api.init_rtr_session(sensor_id)
-            if event_platform == 'Windows':
-                command = self.falcon_api.execute_rtr_command(
-                    'RTR_ExecuteCommand',
-                    session[0]['session_id'],
-                    'reg query',
-                    'reg query "HKEY_LOCAL_MACHINE\\SOFTWARE\\Microsoft\\Provisioning\\OMADM\\MDMDeviceID" DeviceClientId'
-                )
-                response = self.falcon_api.check_rtr_command_status(command[0]['cloud_request_id'], 0)[0]
-                while not response['complete']:
-                    response = self.falcon_api.check_rtr_command_status(command[0]['cloud_request_id'], 0)[0]
-                if response['stderr']:
-                    self._mdm_id[sensor_id] = None
-                else:
-                    self._mdm_id[sensor_id] = response['stdout'].split(' = ')[1].split('\n')[0]
-            elif event_platform == 'Mac':
-                command = self.falcon_api.execute_rtr_command(
-                    'RTR_ExecuteAdminCommand',
-                    session[0]['session_id'],
-                    'runscript',
-                    "runscript -Raw=```system_profiler SPHardwareDataType | awk '/UUID/ { print $3; }'```"
-                )
-                response = self.falcon_api.check_rtr_command_status(command[0]['cloud_request_id'], 0)[0]
-                while not response['complete']:
-                    response = self.falcon_api.check_rtr_command_status(command[0]['cloud_request_id'], 0)[0]
-                if response['stderr']:
-                    self._mdm_id[sensor_id] = None
-                else:
-                    self._mdm_id[sensor_id] = response['stdout'].split('\n')[0]
+        # Hosts without MDM identifier (or where the lookup failed) are cached as None for cache.rtr_negative_ttl
+        # and concurrent events for the same host wait for a single RTR lookup
+        return self._mdm_id.get_or_load(sensor_id, lambda: self._load_mdm_identifier(sensor_id, event_platform))
+
+    def _load_mdm_identifier(self, sensor_id, event_platform):
+        if event_platform not in self._mdm_loaders:
+            return None
+        try:
+            return self._mdm_loaders[event_platform].load(sensor_id)
+        except ApiError as e:
+            log.warning("Cannot fetch MDM identifier from host (aid=%s, platform=%s): %s", sensor_id, event_platform, e)
+            return None
+
+    def _fetch_mdm_identifiers(self, event_platform, sensor_ids):
+        action, base_command, command_string, parse = self.MDM_COMMANDS[event_platform]
+        responses = self.falcon_api.rtr_execute_many(sensor_ids, action, base_command, command_string)
+
+        results = {}
+        for sensor_id in sensor_ids:
+            response = responses.get(sensor_id)
+            if isinstance(response, Exception):
+                results[sensor_id] = response
+            elif response is None or response['stderr']:
+                results[sensor_id] = None
             else:
-                self._mdm_id[sensor_id] = None
-
-        return self._mdm_id[sensor_id]
+                try:
+                    results[sensor_id] = parse(response['stdout'])
+                except IndexError as e:
+                    log.warning("Cannot parse MDM identifier of host (aid=%s, platform=%s): %s", sensor_id, event_platform, e)
+                    results[sensor_id] = None
+        return results
 
 
 class FalconEvent():
@@ -104,6 +185,15 @@ class FalconEvent():
         self.original_event = original_event
         self.cache = cache
 
+    @cached_property
+    def original_json(self):
+        """JSON encoding of the original event, computed once and shared by all the backends"""
+        raw = getattr(self.original_event, 'raw', None)
+        if raw is not None:
+            # Event as received from the stream can be passed through verbatim
+            return raw.decode('utf-8')
+        return jsoncodec.dumps(self.original_event)
+
     @property
     def device_details(self):
         return self.cache.device_details(self.original_event.sensor_id)
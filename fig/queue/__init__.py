@@ -1,23 +1,97 @@
 import queue
 import threading
+import time
+from .checkpoint import Checkpointer, CheckpointStore, OffsetTracker
+from .spool import SegmentSpool
+from ..config import config
+from ..falcon import RawEvent
 
 
-class FalconEvents(queue.Queue):
+class FalconEvents(queue.Queue):  # pylint: disable=too-many-instance-attributes
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.offset = {}
-        self._lock = threading.Lock()
+        self.offsets = OffsetTracker()
+        self.high_water_mark = 0
+        self.full_count = 0
+        self.full_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self.spool = None
+        self.spool_threshold = 0
+        self.spooled_count = 0
+
+    def enable_spool(self, spool, threshold):
+        """Keep at most `threshold` events in memory, overflow the rest to the on-disk spool"""
+        with self.mutex:
+            self.spool = spool
+            self.spool_threshold = threshold
+
+    def put(self, item, block=True, timeout=None):
+        if not self.full():
+            super().put(item, block, timeout)
+            return
+
+        # Producer has to wait for the workers. Account for the time spent waiting, so the operators can tell
+        # how much the backends are holding back the stream.
+        started = time.monotonic()
+        try:
+            super().put(item, block, timeout)
+        finally:
+            with self._stats_lock:
+                self.full_count += 1
+                self.full_seconds += time.monotonic() - started
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size': self.qsize(),
+                'max_size': self.maxsize,
+                'high_water_mark': self.high_water_mark,
+                'full_count': self.full_count,
+                'full_seconds': round(self.full_seconds, 3),
+                'spooled': len(self.spool) if self.spool is not None else 0,
+                'spooled_count': self.spooled_count,
+            }
 
     def last_offset(self, feed_id):
-        return self.offset.get(feed_id, 0)
+        return self.offsets.last_seen(feed_id)
+
+    def restore_offsets(self, offsets):
+        self.offsets.restore(offsets)
+
+    def committed_offsets(self):
+        return self.offsets.watermarks()
+
+    def skip(self, event):
+        self.offsets.skipped(event.feed_id, event.offset)
+
+    def done(self, event):
+        self.offsets.completed(event.feed_id, event.offset)
+
+    # _put and _get are invoked by queue.Queue while holding the queue mutex, so the offset bookkeeping
+    # happens atomically with the event becoming visible to (or being taken by) a worker thread.
+    # Once anything is spooled, all subsequent events are spooled as well to preserve the stream order.
+    def _put(self, item):
+        if self.spool is not None and (len(self.spool) > 0 or len(self.queue) >= self.spool_threshold):
+            self.spool.append(item.feed_id, item.raw)
+            self.spooled_count += 1
+        else:
+            super()._put(item)
+        self.offsets.enqueued(item.feed_id, item.offset)
+        self.high_water_mark = max(self.high_water_mark, self._qsize())
+
+    def _get(self):
+        if self.queue or self.spool is None:
+            item = super()._get()
+        else:
+            feed_id, payload = self.spool.pop()
+            item = RawEvent(payload, feed_id)
+        self.offsets.dequeued(item.feed_id, item.offset)
+        return item
+
+    def _qsize(self):
+        return len(self.queue) + (len(self.spool) if self.spool is not None else 0)
 
-    def get(self, *args, **kwargs):
-        event = super().get(*args, **kwargs)
-        feed_id = event.feed_id
-        offset = event.offset
-        with self._lock:
-            self.offset[feed_id] = max(offset, self.last_offset(feed_id))
-        return event
 
+falcon_events = FalconEvents(maxsize=config.queue_max_size())
 
-falcon_events = FalconEvents()
+__all__ = ['FalconEvents', 'falcon_events', 'Checkpointer', 'CheckpointStore', 'SegmentSpool']
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from ..log import log
+
+
+class OffsetTracker():
+    """Track per-feed offsets of events flowing through the queue.
+
+    The committed watermark of a feed is the highest offset for which every event at or below it has been fully
+    processed. Events leave the queue in stream order, so only the events currently held by worker threads can
+    complete out of order; those are the only offsets that need to be remembered individually.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._dequeued = {}
+        self._queued = Counter()
+        self._in_flight = {}
+        self._committed = {}
+
+    def restore(self, offsets):
+        with self._lock:
+            for feed_id, offset in offsets.items():
+                self._committed[feed_id] = max(offset, self._committed.get(feed_id, 0))
+                self._seen[feed_id] = max(offset, self._seen.get(feed_id, 0))
+
+    def last_seen(self, feed_id):
+        with self._lock:
+            return self._seen.get(feed_id, 0)
+
+    def skipped(self, feed_id, offset):
+        """Event was read from the stream, but it was never put on the queue"""
+        with self._lock:
+            self._seen[feed_id] = max(offset, self._seen.get(feed_id, 0))
+
+    def enqueued(self, feed_id, offset):
+        with self._lock:
+            self._seen[feed_id] = max(offset, self._seen.get(feed_id, 0))
+            self._queued[feed_id] += 1
+
+    def dequeued(self, feed_id, offset):
+        with self._lock:
+            self._queued[feed_id] -= 1
+            self._dequeued[feed_id] = max(offset, self._dequeued.get(feed_id, 0))
+            self._in_flight.setdefault(feed_id, Counter())[offset] += 1
+
+    def completed(self, feed_id, offset):
+        with self._lock:
+            in_flight = self._in_flight.get(feed_id)
+            if not in_flight or offset not in in_flight:
+                return
+            in_flight[offset] -= 1
+            if in_flight[offset] <= 0:
+                del in_flight[offset]
+
+    def watermark(self, feed_id):
+        with self._lock:
+            return self._watermark(feed_id)
+
+    def watermarks(self):
+        with self._lock:
+            return {feed_id: self._watermark(feed_id) for feed_id in self._seen}
+
+    def _watermark(self, feed_id):
+        in_flight = self._in_flight.get(feed_id)
+        if in_flight:
+            watermark = min(in_flight) - 1
+        elif self._queued[feed_id] > 0:
+            watermark = self._dequeued.get(feed_id, 0)
+        else:
+            watermark = self._seen.get(feed_id, 0)
+        # Never move backwards past what was committed in the previous run
+        return max(watermark, self._committed.get(feed_id, 0))
+
+
+class CheckpointStore():
+    """Persist committed offsets of each feed in a local SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                             'feed_id TEXT PRIMARY KEY, '
+                             'offset INTEGER NOT NULL, '
+                             'updated_at REAL NOT NULL)')
+
+    def load(self):
+        with self._lock:
+            rows = self._db.execute('SELECT feed_id, offset FROM checkpoints').fetchall()
+        return dict(rows)
+
+    def save(self, offsets):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO checkpoints (feed_id, offset, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(feed_id) DO UPDATE SET offset = excluded.offset, updated_at = excluded.updated_at',
+                [(str(feed_id), offset, now) for feed_id, offset in offsets.items()])
+
+
+class Checkpointer():
+    """Flush committed offsets of the queue to the checkpoint store. Meant to be run periodically."""
+
+    def __init__(self, queue, store):
+        self.queue = queue
+        self.store = store
+        self._flushed = {}
+
+    def flush(self):
+        offsets = self.queue.committed_offsets()
+        changed = {k: v for k, v in offsets.items() if self._flushed.get(k) != v}
+        if not changed:
+            return
+        try:
+            self.store.save(changed)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Could not persist stream offsets to %s", self.store.path)
+            return
+        self._flushed.update(changed)
+        log.debug("Persisted stream offsets: %s", changed)
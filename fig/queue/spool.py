@@ -0,0 +1,94 @@
+import os
+import struct
+from ..log import log
+
+
+class SegmentSpool():
+    """FIFO of serialized events kept in append-only segment files on the local disk.
+
+    Records are appended to the newest segment and read back from the oldest one. A segment is removed as soon
+    as it has been read completely. The spool is an overflow buffer, not a durable store: events that were
+    spooled when the process died are read again from the Falcon stream based on the committed offsets.
+    """
+    HEADER = struct.Struct('>IH')
+
+    def __init__(self, directory, segment_size):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._segments = []
+        self._writer = None
+        self._reader = None
+        self._next_segment = 0
+        self._count = 0
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale_segments()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, feed_id, payload):
+        if self._writer is None or self._writer.tell() >= self.segment_size:
+            self._rotate()
+        feed_id = str(feed_id).encode('utf-8')
+        self._writer.write(self.HEADER.pack(len(payload), len(feed_id)))
+        self._writer.write(feed_id)
+        self._writer.write(payload)
+        self._count += 1
+
+    def pop(self):
+        if self._count == 0:
+            return None
+
+        while True:
+            if self._reader is None:
+                self._reader = open(self._segments[0], 'rb')  # pylint: disable=consider-using-with
+            if self._writer is not None and self._segments[0] == self._writer.name:
+                self._writer.flush()
+
+            header = self._reader.read(self.HEADER.size)
+            if header:
+                break
+            # Oldest segment is exhausted, move on to the next one
+            self._drop_oldest_segment()
+
+        payload_length, feed_id_length = self.HEADER.unpack(header)
+        feed_id = self._reader.read(feed_id_length).decode('utf-8')
+        payload = self._reader.read(payload_length)
+        self._count -= 1
+        if self._count == 0:
+            self._reset()
+        return feed_id, payload
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+        path = os.path.join(self.directory, 'segment-{:08d}.spool'.format(self._next_segment))
+        self._next_segment += 1
+        self._writer = open(path, 'wb')  # pylint: disable=consider-using-with
+        self._segments.append(path)
+
+    def _drop_oldest_segment(self):
+        self._reader.close()
+        self._reader = None
+        path = self._segments.pop(0)
+        if self._writer is not None and self._writer.name == path:
+            self._writer.close()
+            self._writer = None
+        os.remove(path)
+
+    def _reset(self):
+        # Spool has been drained completely, start over with a fresh segment next time
+        for stream in (self._reader, self._writer):
+            if stream is not None:
+                stream.close()
+        self._reader = None
+        self._writer = None
+        for path in self._segments:
+            os.remove(path)
+        self._segments = []
+
+    def _remove_stale_segments(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.spool'):
+                log.info("Removing stale spool segment %s", name)
+                os.remove(os.path.join(self.directory, name))
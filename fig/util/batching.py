@@ -0,0 +1,172 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class CoalescingLoader():
+    """Load values by key, coalescing concurrent requests into batches.
+
+    The first thread that requests a key not being loaded yet becomes the leader of a new batch. It waits up to
+    `window` seconds (or until `max_batch` keys are pending) for other threads to add their keys and then calls
+    `fetch_many` once for the whole batch. Threads requesting a key that is already pending or in flight wait
+    for that request instead of issuing a new one.
+
+    `fetch_many(keys)` returns a dictionary with a value for each requested key; a value may be an exception
+    instance, which is then raised to the threads waiting for that key.
+    """
+
+    def __init__(self, fetch_many, window, max_batch):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._in_flight = {}
+        self._deadline = 0
+
+    def load(self, key):
+        leader = False
+        with self._cond:
+            future = self._in_flight.get(key) or self._pending.get(key)
+            if future is None:
+                future = Future()
+                self._pending[key] = future
+                if len(self._pending) == 1:
+                    leader = True
+                    self._deadline = time.monotonic() + self.window
+                elif len(self._pending) >= self.max_batch:
+                    self._cond.notify_all()
+
+        if leader:
+            self._lead()
+        return future.result()
+
+    def _lead(self):
+        with self._cond:
+            while len(self._pending) < self.max_batch:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending
+            self._pending = {}
+            self._in_flight.update(batch)
+
+        try:
+            keys = list(batch)
+            for i in range(0, len(keys), self.max_batch):
+                self._resolve({k: batch[k] for k in keys[i:i + self.max_batch]})
+        finally:
+            with self._cond:
+                for key in batch:
+                    self._in_flight.pop(key, None)
+
+    def _resolve(self, batch):
+        try:
+            results = self.fetch_many(list(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for key, future in batch.items():
+            if key not in results:
+                future.set_exception(KeyError(key))
+            elif isinstance(results[key], Exception):
+                future.set_exception(results[key])
+            else:
+                future.set_result(results[key])
+
+
+class Batcher():  # pylint: disable=too-many-instance-attributes
+    """Collect items submitted by many threads and hand them over to `flush` in batches.
+
+    A batch is closed once it holds `max_items` items, once the next item would push it over `max_bytes` (sizes
+    are given by the submitter), or `linger` seconds after its first item arrived. Closed batches are flushed by
+    `threads` background threads; submit() blocks while `threads` batches are already waiting, so a slow sink
+    pushes back on the submitters.
+
+    `flush(items)` returns a list with a result for each item, in order; a result may be an exception instance
+    marking the item as failed. An exception raised by `flush` fails the whole batch. submit() returns a Future
+    resolved with the result of the item.
+    """
+
+    def __init__(self, name, flush, max_items, max_bytes=None, linger=0.1, threads=1):
+        self.name = name
+        self.flush = flush
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.max_ready = threads
+        self._cond = threading.Condition()
+        self._items = []
+        self._bytes = 0
+        self._deadline = 0
+        self._ready = []
+        self.batches = 0
+        self.items = 0
+        for i in range(threads):
+            threading.Thread(target=self._run, name='{}-batch-{}'.format(name, i), daemon=True).start()
+
+    def submit(self, item, size=0):
+        future = Future()
+        with self._cond:
+            while len(self._ready) >= self.max_ready:
+                self._cond.wait()
+            if self._items and self.max_bytes is not None and self._bytes + size > self.max_bytes:
+                self._close()
+            if not self._items:
+                self._deadline = time.monotonic() + self.linger
+            self._items.append((item, future))
+            self._bytes += size
+            if len(self._items) >= self.max_items:
+                self._close()
+            self._cond.notify_all()
+        return future
+
+    def stats(self):
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'pending': len(self._items) + sum(len(batch) for batch in self._ready),
+            }
+
+    def _close(self):
+        # Caller holds the lock
+        self._ready.append(self._items)
+        self._items = []
+        self._bytes = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    if self._items:
+                        remaining = self._deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._close()
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                batch = self._ready.pop(0)
+                self.batches += 1
+                self.items += len(batch)
+                self._cond.notify_all()
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            results = self.flush([item for item, _future in batch])
+        except Exception as e:  # pylint: disable=broad-except
+            results = [e] * len(batch)
+        if len(results) != len(batch):
+            results = [Exception('Batch {} flushed {} items but returned {} results'.format(
+                self.name, len(batch), len(results)))] * len(batch)
+
+        for (_item, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
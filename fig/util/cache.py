@@ -0,0 +1,214 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from . import jsoncodec
+from ..log import log
+
+
+def is_negative(value):
+    return value is None or isinstance(value, Exception)
+
+
+class TTLCache():  # pylint: disable=too-many-instance-attributes
+    """Thread-safe, size-bounded cache with per-entry expiration and least-recently-used eviction.
+
+    Negative results (None, or an exception instance describing a failed lookup) are kept for `negative_ttl`
+    seconds, so failed lookups are retried sooner than successful ones are refreshed.
+
+    When a CacheStore is given, entries are also written to it and entries missing in memory are looked up in
+    it, so the cache content survives restarts. Exceptions are kept in memory only.
+    """
+
+    def __init__(self, name, maxsize, ttl, negative_ttl, store=None):
+        self.name = name
+        self.store = store
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.restored = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        try:
+            self.get(key)
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            if self.store is None:
+                self.misses += 1
+                raise KeyError(key)
+
+        entry = self.store.load(self.name, key)
+        with self._lock:
+            if entry is None or entry[1] <= time.time():
+                self.misses += 1
+                raise KeyError(key)
+            self._insert(key, entry)
+            self.restored += 1
+            return entry[0]
+
+    def put(self, key, value):
+        ttl = self.negative_ttl if is_negative(value) else self.ttl
+        entry = (value, time.time() + ttl)
+        with self._lock:
+            self._insert(key, entry)
+        if self.store is not None and not isinstance(value, Exception):
+            self.store.save(self.name, key, value, entry[1])
+
+    def _insert(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, load):
+        """Return cached value or call load() to obtain it. Concurrent loads of the same key are coalesced."""
+        try:
+            return self.get(key)
+        except KeyError:
+            pass
+
+        with self._flight(key):
+            try:
+                # Value may have been loaded by another thread while this one was waiting
+                return self.get(key)
+            except KeyError:
+                pass
+            value = load()
+            self.put(key, value)
+            return value
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_v, expires_at) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'restored': self.restored,
+            }
+
+    @contextmanager
+    def _flight(self, key):
+        with self._lock:
+            lock, users = self._flights.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._flights[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._flights[key]
+                if users <= 1:
+                    del self._flights[key]
+                else:
+                    self._flights[key] = (lock, users - 1)
+
+
+class CacheStore():
+    """SQLite file backing TTLCache instances.
+
+    Entries are read on demand and written behind by a background thread, so cache lookups and updates done
+    by worker threads do not wait for the disk.
+    """
+    WRITE_BATCH_SIZE = 500
+    PURGE_INTERVAL = 3600
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                             'cache TEXT NOT NULL, '
+                             'key TEXT NOT NULL, '
+                             'value TEXT NOT NULL, '
+                             'expires_at REAL NOT NULL, '
+                             'PRIMARY KEY (cache, key))')
+        self._writes = queue.Queue()
+        self._next_purge = 0
+        threading.Thread(target=self._write_behind, name='cache_store', daemon=True).start()
+
+    @classmethod
+    def shared(cls, path):
+        """Return the store of the given file, shared by all the caches of the process"""
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path)
+            return cls._shared[path]
+
+    def load(self, cache, key):
+        with self._lock:
+            row = self._db.execute('SELECT value, expires_at FROM entries WHERE cache = ? AND key = ?',
+                                   (cache, str(key))).fetchone()
+        if row is None:
+            return None
+        return jsoncodec.loads(row[0]), row[1]
+
+    def save(self, cache, key, value, expires_at):
+        self._writes.put((cache, str(key), jsoncodec.dumps(value), expires_at))
+
+    def _write_behind(self):
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Could not persist %d cache entries to %s", len(batch), self.path)
+
+    def _flush(self, batch):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO entries (cache, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                                 batch)
+            if now >= self._next_purge:
+                self._db.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+                self._next_purge = now + self.PURGE_INTERVAL
@@ -0,0 +1,82 @@
+"""JSON encoding and decoding backed by the fastest library available.
+
+orjson or ujson are used when installed (pip install falcon-integration-gateway[speedups]), the standard
+library json module otherwise. The codec can be forced with the main.json_codec option. All codecs produce
+UTF-8 JSON without escaping non-ASCII characters.
+"""
+import json
+from ..config import config
+
+try:
+    import orjson  # pylint: disable=import-error
+except ImportError:
+    orjson = None
+
+try:
+    import ujson  # pylint: disable=import-error
+except ImportError:
+    ujson = None
+
+
+def _stdlib_codec():
+    def decode(data):
+        return json.loads(data)
+
+    def encode(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    def encode_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    return 'json', decode, encode, encode_bytes
+
+
+def _orjson_codec():
+    def encode(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    return 'orjson', orjson.loads, encode, orjson.dumps
+
+
+def _ujson_codec():
+    def encode(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    def encode_bytes(obj):
+        return encode(obj).encode('utf-8')
+
+    return 'ujson', ujson.loads, encode, encode_bytes
+
+
+CODECS = {
+    'json': _stdlib_codec,
+    'orjson': _orjson_codec if orjson is not None else None,
+    'ujson': _ujson_codec if ujson is not None else None,
+}
+
+
+def select(codec=None):
+    """Return (name, loads, dumps, dumpb) of the requested codec or of the fastest available one"""
+    if codec:
+        if CODECS.get(codec) is None:
+            raise Exception('JSON codec {} is not available'.format(codec))
+        return CODECS[codec]()
+    for candidate in ('orjson', 'ujson', 'json'):
+        if CODECS[candidate] is not None:
+            return CODECS[candidate]()
+    raise Exception('No JSON codec available')
+
+
+name, loads, dumps, dumpb = select(config.get('main', 'json_codec'))
+
+
+def dumps_with_fragments(obj, fragments):
+    """Encode dictionary obj and add members whose values are already encoded JSON strings (not re-encoded)"""
+    encoded = dumps(obj)
+    members = ','.join('{}:{}'.format(dumps(key), fragment) for key, fragment in fragments.items())
+    if not members:
+        return encoded
+    return encoded[:-1] + (',' if obj else '') + members + '}'
+
+
+__all__ = ['name', 'loads', 'dumps', 'dumpb', 'dumps_with_fragments', 'select']
@@ -0,0 +1,75 @@
+import heapq
+import itertools
+import threading
+import time
+from ..log import log
+
+
+class ScheduledTask():
+    def __init__(self, func, args, interval):
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return '{}({}, interval={})'.format(self.__class__.__name__, getattr(self.func, '__qualname__', self.func),
+                                            self.interval)
+
+
+class Scheduler():
+    """Run delayed and periodic tasks from a single thread.
+
+    Tasks are kept in a heap ordered by their due time. The thread is started when the first task is scheduled.
+    Tasks should be short; an exception raised by a task is logged and periodic tasks keep running. The next run
+    of a periodic task is scheduled `interval` seconds after the previous run finished.
+    """
+
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay, func, *args):
+        return self._schedule(delay, ScheduledTask(func, args, None))
+
+    def call_every(self, interval, func, *args, delay=None):
+        return self._schedule(interval if delay is None else delay, ScheduledTask(func, args, interval))
+
+    def __len__(self):
+        with self._cond:
+            return sum(1 for _due, _seq, task in self._tasks if not task.cancelled)
+
+    def _schedule(self, delay, task):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            heapq.heappush(self._tasks, (time.monotonic() + delay, next(self._sequence), task))
+            self._cond.notify()
+        return task
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._tasks or self._tasks[0][0] > time.monotonic():
+                    self._cond.wait(self._tasks[0][0] - time.monotonic() if self._tasks else None)
+                _due, _seq, task = heapq.heappop(self._tasks)
+
+            if task.cancelled:
+                continue
+            try:
+                task.func(*task.args)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Scheduled task %s failed", task)
+
+            if task.interval is not None and not task.cancelled:
+                self._schedule(task.interval, task)
+
+
+scheduler = Scheduler()
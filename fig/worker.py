@@ -1,6 +1,7 @@
 import threading
+from functools import partial
 from .log import log
-from .falcon_data import FalconEvent, EventDataError
+from .falcon_data import FalconEvent
 
 
 class WorkerThread(threading.Thread):
@@ -13,14 +14,15 @@ class WorkerThread(threading.Thread):
 
     def run(self):
         while True:
+            event = self.input_queue.get()
             try:
-                event = self.input_queue.get()
-                self.process_event(event)
-            except EventDataError:
-                log.exception("Could not translate falcon event to cloud provider")
+                falcon_event = FalconEvent(event.parse(), self.cache)
             except Exception:  # pylint: disable=W0703
                 log.exception("Error occurred while processing event %s", event)
-
-    def process_event(self, event):
-        falcon_event = FalconEvent(event, self.cache)
-        self.backends.process(falcon_event)
+                self.input_queue.done(event)
+                continue
+            try:
+                # Event is done once every backend it was routed to has delivered it (or right away on failure)
+                self.backends.process(falcon_event, partial(self.input_queue.done, event))
+            except Exception:  # pylint: disable=W0703
+                log.exception("Error occurred while routing event %s", event)
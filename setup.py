@@ -21,7 +21,7 @@ setup(
     include_package_data=True,
     install_requires=[
         'boto3',
-        'crowdstrike-falconpy',
+        'crowdstrike-falconpy>=1.6.5',
         'azure-monitor-ingestion==1.0.4',
         'azure-identity>=1.25.3',
         'google-cloud-securitycenter',
@@ -38,6 +38,9 @@ setup(
             'pytest',
             'bandit',
         ],
+        'speedups': [
+            'orjson',
+        ],
     },
     classifiers=[
         "Development Status :: 4 - Beta",
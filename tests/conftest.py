@@ -0,0 +1,15 @@
+import time
+import pytest
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def wait_for():
+    """Poll until condition() is true, for effects of background threads"""
+    return _wait_for
@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fig.util.batching import Batcher, CoalescingLoader
+
+
+def test_concurrent_loads_are_coalesced():
+    batches = []
+
+    def fetch_many(keys):
+        batches.append(sorted(keys))
+        return {key: key * 2 for key in keys}
+
+    loader = CoalescingLoader(fetch_many, window=0.2, max_batch=100)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(loader.load, [1, 2, 3, 1, 2, 3, 4, 4]))
+
+    assert results == [2, 4, 6, 2, 4, 6, 8, 8]
+    assert batches == [[1, 2, 3, 4]]
+
+
+def test_batch_is_flushed_once_full():
+    batches = []
+    loader = CoalescingLoader(lambda keys: batches.append(len(keys)) or {k: k for k in keys}, window=10, max_batch=3)
+    with ThreadPoolExecutor(3) as pool:
+        assert list(pool.map(loader.load, [1, 2, 3])) == [1, 2, 3]
+    assert batches == [3]
+
+
+def test_errors_are_raised_to_waiting_threads():
+    loader = CoalescingLoader(lambda keys: {1: ValueError('bad host')}, window=0, max_batch=10)
+    with pytest.raises(ValueError):
+        loader.load(1)
+
+    loader = CoalescingLoader(lambda keys: {}, window=0, max_batch=10)
+    with pytest.raises(KeyError):
+        loader.load(1)
+
+
+def test_failed_fetch_fails_the_whole_batch():
+    def fetch_many(keys):
+        raise ConnectionError('api down')
+
+    loader = CoalescingLoader(fetch_many, window=0.1, max_batch=10)
+    errors = []
+
+    def load(key):
+        try:
+            loader.load(key)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load, args=(key,)) for key in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+
+
+def test_batcher_closes_full_batches():
+    batches = []
+    batcher = Batcher('test', lambda items: batches.append(list(items)) or items, max_items=3, linger=10)
+    futures = [batcher.submit(i) for i in range(6)]
+    assert [future.result(timeout=5) for future in futures] == list(range(6))
+    assert batches == [[0, 1, 2], [3, 4, 5]]
+    assert batcher.stats() == {'batches': 2, 'items': 6, 'pending': 0}
+
+
+def test_batcher_respects_max_bytes():
+    batches = []
+    batcher = Batcher('test', lambda items: batches.append(list(items)) or items, max_items=100, max_bytes=10,
+                      linger=0.05)
+    futures = [batcher.submit(i, size=4) for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_batcher_flushes_after_linger():
+    batcher = Batcher('test', lambda items: ['ok'] * len(items), max_items=100, linger=0.05)
+    assert batcher.submit('item').result(timeout=5) == 'ok'
+
+
+def test_batcher_reports_failures_per_item():
+    batcher = Batcher('test', lambda items: [ValueError(i) if i % 2 else i for i in items], max_items=4, linger=10)
+    futures = [batcher.submit(i) for i in range(4)]
+    assert futures[0].result(timeout=5) == 0
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+
+
+def test_batcher_fails_whole_batch():
+    def flush(items):
+        raise ConnectionError('sink down')
+
+    batcher = Batcher('test', flush, max_items=2, linger=10)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(timeout=5)
+
+    batcher = Batcher('test', lambda items: items[:1], max_items=2, linger=10)
+    with pytest.raises(Exception, match='returned 1 results'):
+        [batcher.submit(i) for i in range(2)][1].result(timeout=5)
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fig.util import cache as cache_module
+from fig.util.cache import CacheStore, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def test_entries_expire(clock):
+    cache = TTLCache('test', 10, ttl=60, negative_ttl=5)
+    cache.put('found', {'id': 1})
+    cache.put('missing', None)
+
+    clock[0] += 10
+    assert cache.get('found') == {'id': 1}
+    assert 'missing' not in cache
+
+    clock[0] += 60
+    assert 'found' not in cache
+    assert cache.stats()['expirations'] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache('test', 2, ttl=60, negative_ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_purge_expired(clock):
+    cache = TTLCache('test', 10, ttl=60, negative_ttl=5)
+    cache.put('a', 1)
+    cache.put('b', ValueError('failed'))
+    clock[0] += 10
+    assert cache.purge_expired() == 1
+    assert len(cache) == 1
+
+
+def test_concurrent_loads_of_a_key_are_coalesced():
+    cache = TTLCache('test', 10, ttl=60, negative_ttl=60)
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'value'
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: cache.get_or_load('key', load), range(8)))
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+
+
+def test_entries_survive_restart(tmp_path, wait_for):
+    path = str(tmp_path / 'cache.db')
+    store = CacheStore(path)
+    TTLCache('devices', 10, ttl=60, negative_ttl=60, store=store).put('aid', {'hostname': 'host'})
+    TTLCache('devices', 10, ttl=60, negative_ttl=60, store=store).put('failed', ValueError('not persisted'))
+    wait_for(lambda: store.load('devices', 'aid') is not None)
+
+    restored = TTLCache('devices', 10, ttl=60, negative_ttl=60, store=CacheStore(path))
+    assert restored.get('aid') == {'hostname': 'host'}
+    assert 'failed' not in restored
+    assert restored.stats()['restored'] == 1
+
+
+def test_shared_store_per_path(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    assert CacheStore.shared(path) is CacheStore.shared(path)
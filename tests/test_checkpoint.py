@@ -0,0 +1,91 @@
+from fig.queue.checkpoint import CheckpointStore, OffsetTracker
+
+
+def track(tracker, feed_id, *offsets):
+    for offset in offsets:
+        tracker.enqueued(feed_id, offset)
+    for offset in offsets:
+        tracker.dequeued(feed_id, offset)
+
+
+def test_watermark_waits_for_out_of_order_completion():
+    tracker = OffsetTracker()
+    track(tracker, 0, 1, 2, 3)
+
+    tracker.completed(0, 3)
+    tracker.completed(0, 2)
+    assert tracker.watermark(0) == 0
+
+    tracker.completed(0, 1)
+    assert tracker.watermark(0) == 3
+
+
+def test_watermark_stops_below_oldest_event_in_flight():
+    tracker = OffsetTracker()
+    track(tracker, 0, 10, 11, 12)
+
+    tracker.completed(0, 10)
+    tracker.completed(0, 12)
+    assert tracker.watermark(0) == 10
+
+
+def test_watermark_does_not_pass_queued_events():
+    tracker = OffsetTracker()
+    tracker.enqueued(0, 1)
+    tracker.enqueued(0, 2)
+    tracker.dequeued(0, 1)
+    tracker.completed(0, 1)
+    assert tracker.watermark(0) == 1
+
+    tracker.dequeued(0, 2)
+    tracker.completed(0, 2)
+    assert tracker.watermark(0) == 2
+
+
+def test_skipped_events_advance_watermark():
+    tracker = OffsetTracker()
+    track(tracker, 0, 1)
+    tracker.skipped(0, 2)
+    tracker.skipped(0, 3)
+    assert tracker.watermark(0) == 0
+
+    tracker.completed(0, 1)
+    assert tracker.watermark(0) == 3
+    assert tracker.last_seen(0) == 3
+
+
+def test_feeds_are_tracked_independently():
+    tracker = OffsetTracker()
+    track(tracker, 0, 5)
+    track(tracker, 1, 7)
+    tracker.completed(1, 7)
+    assert tracker.watermarks() == {0: 4, 1: 7}
+
+
+def test_restore_never_moves_watermark_backwards():
+    tracker = OffsetTracker()
+    tracker.restore({0: 100})
+    assert tracker.last_seen(0) == 100
+    assert tracker.watermark(0) == 100
+
+    track(tracker, 0, 101, 102)
+    tracker.completed(0, 102)
+    assert tracker.watermark(0) == 100
+
+    tracker.completed(0, 101)
+    assert tracker.watermark(0) == 102
+
+
+def test_completing_unknown_offset_is_ignored():
+    tracker = OffsetTracker()
+    track(tracker, 0, 1)
+    tracker.completed(0, 5)
+    tracker.completed(1, 1)
+    assert tracker.watermark(0) == 0
+
+
+def test_store_round_trip(tmp_path):
+    path = str(tmp_path / 'state' / 'checkpoints.db')
+    CheckpointStore(path).save({0: 10, 1: 20})
+    CheckpointStore(path).save({1: 25})
+    assert CheckpointStore(path).load() == {'0': 10, '1': 25}
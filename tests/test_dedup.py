@@ -0,0 +1,45 @@
+import time
+import pytest
+from fig.backends.aws.dedup import FindingIndex
+from fig.util.cache import CacheStore
+
+
+def test_in_memory_index_never_trusts_a_miss():
+    index = FindingIndex(10, ttl=3600)
+    now = time.time()
+    assert index.lookup('a', now) == FindingIndex.UNKNOWN
+    index.add('a')
+    assert index.lookup('a', now) == FindingIndex.EXISTS
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+
+def test_persisted_index_trusts_misses_of_new_detections(store_path):
+    index = FindingIndex(10, ttl=3600, store=CacheStore(store_path))
+    now = time.time()
+    assert index.lookup('new', now + 1) == FindingIndex.NEW
+    # Detections created before the index started recording may have been imported already
+    assert index.lookup('replayed', index.since - 60) == FindingIndex.UNKNOWN
+
+
+def test_persisted_index_survives_restart(store_path, wait_for):
+    store = CacheStore(store_path)
+    index = FindingIndex(1, ttl=3600, store=store)
+    index.add('a')
+    index.add('b')
+    wait_for(lambda: store.load('securityhub_findings', 'a') is not None)
+
+    restarted = FindingIndex(1, ttl=3600, store=CacheStore(store_path))
+    assert restarted.since == index.since
+    assert restarted.lookup('a', time.time()) == FindingIndex.EXISTS
+    assert restarted.lookup('c', time.time()) == FindingIndex.NEW
+
+
+def test_detections_older_than_ttl_are_checked(store_path):
+    index = FindingIndex(10, ttl=60, store=CacheStore(store_path))
+    index.since -= 3600
+    assert index.lookup('a', time.time() - 120) == FindingIndex.UNKNOWN
+    assert index.lookup('a', time.time() - 30) == FindingIndex.NEW
@@ -0,0 +1,19 @@
+from fig.falcon.api import FalconAPI
+from fig.falcon_data import FalconAPIDataError, FalconCache
+
+
+def test_partial_device_details_response_returns_devices_found():
+    api = object.__new__(FalconAPI)
+    api._request = lambda **kwargs: {'status_code': 404, 'body': {
+        'meta': {'trace_id': 't'},
+        'errors': [{'code': 404, 'message': 'Device not found: unknown'}],
+        'resources': [{'device_id': 'known', 'platform_name': 'Linux'}],
+    }}
+    cache = object.__new__(FalconCache)
+    cache.falcon_api = api
+
+    results = cache._fetch_device_details(['known', 'unknown'])
+
+    assert results['known'] == {'device_id': 'known', 'platform_name': 'Linux'}
+    assert isinstance(results['unknown'], FalconAPIDataError)
+    assert 'device not known' in str(results['unknown'])
@@ -0,0 +1,25 @@
+from fig.falcon.linereader import LineReader
+
+
+def test_lines_spanning_chunks():
+    chunks = [b'{"a": 1}\n{"b"', b': 2}\n', b'{"c": 3}\n{"d"', b': 4}']
+    assert list(LineReader(chunks)) == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}', b'{"d": 4}']
+
+
+def test_heartbeats_and_carriage_returns():
+    reader = LineReader([b'\r\n', b'\n{"a": 1}\r\n\r', b'\n'])
+    assert list(reader) == [b'', b'', b'{"a": 1}', b'']
+    stats = reader.stats()
+    assert stats['events'] == 1
+    assert stats['heartbeats'] == 3
+    assert stats['bytes'] == 15
+
+
+def test_many_lines_in_one_chunk():
+    lines = [b'{"offset": %d}' % i for i in range(1000)]
+    assert list(LineReader([b'\n'.join(lines) + b'\n'])) == lines
+
+
+def test_byte_at_a_time():
+    data = b'{"a": 1}\n\n{"b": 2}\n'
+    assert list(LineReader([data[i:i + 1] for i in range(len(data))])) == [b'{"a": 1}', b'', b'{"b": 2}']
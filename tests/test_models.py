@@ -0,0 +1,41 @@
+import json
+from fig.falcon import RawEvent
+
+
+def raw(event, metadata=None, metadata_first=True):
+    metadata = metadata or {'offset': 42, 'eventType': 'DetectionSummaryEvent', 'eventCreationTime': 1700000000000}
+    body = {'metadata': metadata, 'event': event} if metadata_first else {'event': event, 'metadata': metadata}
+    return RawEvent(json.dumps(body).encode('utf-8'), '0')
+
+
+def test_severity_name_of_event():
+    assert raw({'SeverityName': 'Low'}).severity_name == 'Low'
+    assert raw({'Severity': 2}).severity_name == 'Critical'
+
+
+def test_nested_severity_name_is_ignored():
+    event = {'Behaviors': [{'SeverityName': 'Informational'}], 'Tags': {'SeverityName': 'Low'},
+             'Note': '"SeverityName": "Low"', 'SeverityName': 'Critical'}
+    assert raw(event).severity_name == 'Critical'
+    assert raw({'Behaviors': [{'SeverityName': 'Informational'}]}).severity_name == 'Critical'
+
+
+def test_severity_name_outside_event_is_ignored():
+    assert raw({'Severity': 2}, {'offset': 1, 'eventType': 'x', 'SeverityName': 'Low'}).severity_name == 'Critical'
+
+
+def test_non_string_severity_name():
+    assert raw({'SeverityName': None, 'Other': 'Low'}).severity_name == 'Critical'
+
+
+def test_metadata_is_read_from_top_level():
+    event = raw({'metadata': {'offset': 1, 'eventType': 'Nested'}, 'SeverityName': 'High'}, metadata_first=False)
+    assert event.offset == 42
+    assert event.event_type == 'DetectionSummaryEvent'
+    assert event.severity_name == 'High'
+
+
+def test_parse_is_deferred():
+    event = raw({'SeverityName': 'High', 'ComputerName': 'host'})
+    assert event.offset == 42
+    assert event.parse()['event']['ComputerName'] == 'host'
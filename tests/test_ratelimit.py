@@ -0,0 +1,54 @@
+import threading
+import time
+from fig.falcon.ratelimit import RateLimiter
+
+
+def test_burst_is_limited_to_capacity():
+    limiter = RateLimiter(requests_per_minute=60)
+    assert limiter.capacity == 10
+    started = time.monotonic()
+    for _ in range(10):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.5
+    assert limiter.stats()['delayed'] == 0
+
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.5
+    assert limiter.stats()['delayed'] == 1
+
+
+def test_remaining_budget_reported_by_falcon_shrinks_bucket():
+    limiter = RateLimiter(requests_per_minute=6000)
+    limiter.update({'X-RateLimit-Remaining': '3'})
+    assert limiter.stats()['tokens'] == 3
+    limiter.update({'Content-Type': 'application/json'})
+    assert limiter.stats()['tokens'] == 3
+
+
+def test_throttle_pauses_until_announced_time():
+    limiter = RateLimiter(requests_per_minute=6000)
+    assert limiter.throttle({'X-RateLimit-RetryAfter': str(int(time.time()) + 100)}, 1) > 90
+    assert limiter.throttle({'Retry-After': '0.2'}, 1) == 0.2
+    assert limiter.throttle({}, 0.3) == 0.3
+    assert limiter.stats()['throttled'] == 3
+
+
+def test_high_priority_callers_are_served_first():
+    limiter = RateLimiter(requests_per_minute=600)
+    for _ in range(int(limiter.capacity)):
+        limiter.acquire()
+
+    served = []
+
+    def acquire(priority, name):
+        limiter.acquire(priority)
+        served.append(name)
+
+    normal = threading.Thread(target=acquire, args=(RateLimiter.NORMAL, 'normal'))
+    normal.start()
+    time.sleep(0.02)
+    high = threading.Thread(target=acquire, args=(RateLimiter.HIGH, 'high'))
+    high.start()
+    normal.join(5)
+    high.join(5)
+    assert served == ['high', 'normal']
@@ -0,0 +1,78 @@
+import pytest
+from fig.falcon.errors import RTRConnectionError, RTRError
+from fig.falcon.rtr import RTRBatchSession, RTRCommandPoller
+
+
+class FakeFalconAPI():
+    def __init__(self, uploads):
+        self.rtr_poller = RTRCommandPoller(timeout=5)
+        self.uploads = uploads
+        self.status_calls = 0
+        self.deleted = []
+
+    def batch_init_rtr_sessions(self, device_ids, timeout):
+        return {'batch_id': 'batch', 'resources': {
+            'a': {'session_id': 's-a', 'complete': True, 'errors': []},
+            'b': {'session_id': 's-b', 'complete': True, 'errors': []},
+            'c': {'session_id': '', 'complete': False, 'errors': [{'message': 'offline'}]},
+        }}
+
+    def batch_execute_rtr_command(self, action, batch_id, device_ids, base_command, command_string, timeout):
+        return {
+            'a': {'session_id': 's-a', 'complete': True, 'stdout': 'id-a', 'stderr': '', 'errors': None},
+            'b': {'session_id': 's-b', 'complete': False, 'stdout': '', 'stderr': '', 'errors': None},
+        }
+
+    def batch_get_rtr_file(self, batch_id, device_ids, filepath, timeout):
+        return {'batch_get_cmd_req_id': 'req', 'combined': {'resources': {
+            'a': {'session_id': 's-a', 'complete': True, 'stderr': ''},
+            'b': {'session_id': 's-b', 'complete': True, 'stderr': ''},
+        }}}
+
+    def batch_get_rtr_file_status(self, batch_get_cmd_req_id, timeout):
+        self.status_calls += 1
+        return self.uploads[min(self.status_calls, len(self.uploads)) - 1]
+
+    def rtr_extracted_file_contents(self, session_id, sha256, filepath):
+        return 'content of {} from {}'.format(filepath, session_id).encode('utf-8')
+
+    def delete_rtr_sessions(self, session_ids):
+        self.deleted.extend(session_ids)
+
+
+def test_execute_reports_result_of_each_host():
+    api = FakeFalconAPI([])
+    session = RTRBatchSession(api, ['a', 'b', 'c'], timeout=5)
+    results = session.execute('BatchCmd', 'reg query', 'reg query ...')
+    session.close()
+
+    assert results['a']['stdout'] == 'id-a'
+    assert isinstance(results['b'], RTRError)
+    assert isinstance(results['c'], RTRConnectionError)
+    assert sorted(api.deleted) == ['s-a', 's-b']
+
+
+def test_get_file_polls_until_all_files_are_uploaded(monkeypatch):
+    monkeypatch.setattr(RTRCommandPoller, 'INITIAL_DELAY', 0.01)
+    api = FakeFalconAPI([{}, {'a': [{'sha256': 'x'}]}, {'a': [{'sha256': 'x'}], 'b': [{'sha256': 'y'}]}])
+    results = RTRBatchSession(api, ['a', 'b', 'c'], timeout=5).get_file('/etc/config')
+
+    assert api.status_calls == 3
+    assert results['a'] == b'content of /etc/config from s-a'
+    assert results['b'] == b'content of /etc/config from s-b'
+    assert isinstance(results['c'], RTRConnectionError)
+
+
+def test_get_file_returns_partial_results_at_deadline():
+    api = FakeFalconAPI([{'a': [{'sha256': 'x'}]}])
+    results = RTRBatchSession(api, ['a', 'b'], timeout=0.2).get_file('/etc/config')
+
+    assert results['a'] == b'content of /etc/config from s-a'
+    assert isinstance(results['b'], RTRError)
+
+
+def test_poller_fails_commands_past_deadline():
+    poller = RTRCommandPoller(timeout=0.1)
+    with pytest.raises(RTRError):
+        poller.submit(lambda expired: None).result(timeout=5)
+    assert poller.submit(lambda expired: 'done').result(timeout=5) == 'done'
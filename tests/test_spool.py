@@ -0,0 +1,55 @@
+import os
+from fig.falcon import RawEvent
+from fig.queue import FalconEvents, SegmentSpool
+
+
+def event(offset, feed_id='0'):
+    payload = '{{"metadata": {{"offset": {}, "eventType": "DetectionSummaryEvent"}}, "event": {{}}}}'.format(offset)
+    return RawEvent(payload.encode('utf-8'), feed_id)
+
+
+def test_spool_is_fifo_across_segments(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_size=64)
+    for i in range(20):
+        spool.append(i % 2, b'payload-%d' % i)
+    assert len(spool) == 20
+    assert len(os.listdir(str(tmp_path))) > 1
+
+    assert [spool.pop() for _ in range(20)] == [(str(i % 2), b'payload-%d' % i) for i in range(20)]
+    assert spool.pop() is None
+    assert not os.listdir(str(tmp_path))
+
+
+def test_spool_interleaves_reads_and_writes(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_size=32)
+    spool.append('0', b'first')
+    spool.append('0', b'second')
+    assert spool.pop() == ('0', b'first')
+    spool.append('0', b'third')
+    assert spool.pop() == ('0', b'second')
+    assert spool.pop() == ('0', b'third')
+    assert len(spool) == 0
+
+
+def test_stale_segments_are_removed(tmp_path):
+    SegmentSpool(str(tmp_path), segment_size=1024).append('0', b'left over')
+    spool = SegmentSpool(str(tmp_path), segment_size=1024)
+    assert len(spool) == 0
+    assert not os.listdir(str(tmp_path))
+
+
+def test_queue_overflows_to_spool_in_order(tmp_path):
+    events = FalconEvents(maxsize=100)
+    events.enable_spool(SegmentSpool(str(tmp_path), segment_size=256), threshold=2)
+    for offset in range(1, 11):
+        events.put(event(offset))
+    assert events.stats()['spooled'] == 8
+    assert events.qsize() == 10
+
+    offsets = []
+    for _ in range(10):
+        item = events.get()
+        offsets.append(item.offset)
+        events.done(item)
+    assert offsets == list(range(1, 11))
+    assert events.committed_offsets() == {'0': 10}